@@ -0,0 +1,61 @@
+from functools import lru_cache
+import threading
+import json
+import os
+
+# Rules shipped with the repo, override with ACTIVITY_RULES_FILE to add custom sports
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "activity_rules.json")
+
+def get_rules_file():
+    return os.getenv("ACTIVITY_RULES_FILE", DEFAULT_RULES_FILE)
+
+class ActivityClassifier:
+    """
+    Maps a Garmin typeKey and activity name to the (Activity Type, Subactivity Type)
+    pair used in Notion, and to the icon of that type.
+
+    Rules are a dict with:
+    * "types": formatted Garmin type -> [type, subtype], e.g. "Indoor Cycling" -> ["Cycling", "Indoor Cycling"]
+    * "name_keywords": ordered list of {"keyword", "type", "subtype"}, the first keyword found
+      (case-insensitive) in the activity name wins over the type mapping
+    * "icons": type or subtype -> icon URL
+    """
+
+    def __init__(self, rules):
+        self.types = {name: tuple(value) for name, value in rules.get("types", {}).items()}
+        self.keywords = [
+            (rule["keyword"].lower(), (rule["type"], rule["subtype"]))
+            for rule in rules.get("name_keywords", [])
+        ]
+        self.icons = dict(rules.get("icons", {}))
+        # Most activities repeat a handful of (typeKey, name) pairs, so classify each pair once
+        self.classify = lru_cache(maxsize=4096)(self._classify)
+
+    @classmethod
+    def from_file(cls, path=None):
+        with open(path or get_rules_file()) as f:
+            return cls(json.load(f))
+
+    def _classify(self, type_key, activity_name=""):
+        if activity_name:
+            name = activity_name.lower()
+            for keyword, result in self.keywords:
+                if keyword in name:
+                    return result
+
+        formatted_type = type_key.replace('_', ' ').title() if type_key else "Unknown"
+        return self.types.get(formatted_type, (formatted_type, formatted_type))
+
+    def icon(self, activity_type, activity_subtype):
+        return self.icons.get(activity_subtype if activity_subtype != activity_type else activity_type)
+
+_classifier = None
+_lock = threading.Lock()
+
+def get_classifier():
+    # Loaded on first use so ACTIVITY_RULES_FILE can come from a .env file
+    global _classifier
+    with _lock:
+        if _classifier is None:
+            _classifier = ActivityClassifier.from_file()
+        return _classifier
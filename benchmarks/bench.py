@@ -0,0 +1,122 @@
+from contextlib import redirect_stdout
+from datetime import timedelta
+import importlib.util
+import tempfile
+import io
+import argparse
+import time
+import json
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep the benchmark away from the real sync state and mirror
+WORK_DIR = tempfile.mkdtemp()
+os.environ["GARMIN_STATE_FILE"] = os.path.join(WORK_DIR, "garmin-sync-state.json")
+os.environ["GARMIN_MIRROR_FILE"] = os.path.join(WORK_DIR, "garmin-mirror.sqlite")
+
+from notion_writer import NotionWriter, make_notion_client
+from mock_notion import MockNotion
+from fake_garmin import FakeGarmin, FIXTURE_END, make_activities
+
+DATABASE_ID = "00000000-0000-0000-0000-000000000000"
+
+def load_sync_all():
+    spec = importlib.util.spec_from_file_location("sync_all", os.path.join(ROOT, "sync-all.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def run(name, stage, garmin, notion, url, args, **kwargs):
+    """
+    Time one call of a stage's sync() and count the requests it made.
+    """
+    garmin.calls.clear()
+    notion.requests.clear()
+    notion.rate_limited = 0
+
+    # Keep the scripts' own progress output out of the report
+    with redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        client = NotionWriter(make_notion_client("benchmark", args.workers, base_url=url),
+                              max_workers=args.workers, rate=args.rate)
+        started = time.perf_counter()
+        stage.sync(garmin, client, DATABASE_ID, **kwargs)
+        client.close()
+        elapsed = time.perf_counter() - started
+
+    return {
+        "stage": name,
+        "seconds": round(elapsed, 3),
+        "garmin_calls": sum(garmin.calls.values()),
+        "notion_requests": dict(notion.requests),
+        "notion_total": sum(notion.requests.values()),
+        "rate_limited": notion.rate_limited,
+        "pages": len(notion.database_pages(DATABASE_ID)),
+    }
+
+def run_size(size, stages, args):
+    if args.fixtures:
+        garmin = FakeGarmin.from_fixtures(args.fixtures, latency=args.garmin_latency)
+        garmin.activities = garmin.activities[:size]
+    else:
+        garmin = FakeGarmin(make_activities(size), latency=args.garmin_latency)
+
+    start = FIXTURE_END - timedelta(days=size - 1)
+    scenarios = [
+        ("activities", "activities", {"full": True}),
+        # Incremental over the whole history (activities are 13h apart), so unchanged ones are skipped by hash
+        ("activities (re-sync)", "activities", {"lookback_days": size}),
+        ("records", "records", {}),
+        ("steps", "steps", {"start": start, "end": FIXTURE_END}),
+        ("sleep", "sleep", {"start": start, "end": FIXTURE_END}),
+    ]
+
+    results = []
+    for name, stage, kwargs in scenarios:
+        if stage not in args.stages:
+            continue
+        # Each stage gets its own empty database, except a re-sync which reuses the previous one
+        if not name.endswith("(re-sync)"):
+            notion = MockNotion(args.latency, args.jitter, args.rate_limit_every, args.retry_after)
+            url = notion.start()
+            os.environ["GARMIN_MIRROR_FILE"] = os.path.join(WORK_DIR, f"mirror-{size}-{stage}.sqlite")
+        result = run(name, stages[stage], garmin, notion, url, args, **kwargs)
+        result["size"] = size
+        results.append(result)
+        print(f"{size:>6} {name:<22} {result['seconds']:>9.2f}s {result['garmin_calls']:>7} "
+              f"{result['notion_total']:>8} {result['rate_limited']:>5}", flush=True)
+    notion.stop()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the sync stages against a local Notion stand-in and replayed Garmin data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="activities (and days of steps/sleep) per run")
+    parser.add_argument("--stages", nargs="+", default=["activities", "records", "steps", "sleep"])
+    parser.add_argument("--fixtures", help="directory with payloads recorded by record.py, synthetic data otherwise")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every Notion request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra Notion latency, up to this many seconds")
+    parser.add_argument("--garmin-latency", type=float, default=0.0, help="seconds added to every Garmin call")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth Notion request with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After sent with the 429s")
+    parser.add_argument("--rate", type=float, default=1000, help="client-side Notion rate limit (req/s)")
+    parser.add_argument("--workers", type=int, default=3, help="concurrent Notion writes")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the scripts' own output")
+    args = parser.parse_args()
+
+    sync_all = load_sync_all()
+    stages = {name: sync_all.load_stage(script) for name, (script, _) in sync_all.STAGES.items()}
+
+    print(f"{'size':>6} {'stage':<22} {'time':>10} {'garmin':>7} {'notion':>8} {'429':>5}")
+    results = []
+    for size in args.sizes:
+        results += run_size(size, stages, args)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
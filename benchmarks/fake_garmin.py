@@ -0,0 +1,153 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+import threading
+import random
+import json
+import time
+import os
+
+ACTIVITY_TYPES = [
+    "running", "treadmill_running", "cycling", "indoor_cycling", "strength_training",
+    "yoga", "walking", "hiking", "lap_swimming", "indoor_rowing",
+]
+
+# Fixed end date so runs are comparable
+FIXTURE_END = date(2024, 12, 31)
+
+def make_activities(count, seed=0):
+    """
+    Synthetic activities shaped like garminconnect's get_activities() output, newest first.
+    """
+    rng = random.Random(seed)
+    start = datetime.combine(FIXTURE_END, datetime.min.time()).replace(hour=18)
+    activities = []
+    for i in range(count):
+        started = start - timedelta(hours=13 * i)
+        type_key = rng.choice(ACTIVITY_TYPES)
+        duration = rng.uniform(900, 7200)
+        distance = 0 if type_key in ("strength_training", "yoga") else rng.uniform(1000, 40000)
+        activities.append({
+            "activityId": 10_000_000_000 + count - i,
+            "activityName": f"{type_key.replace('_', ' ').title()} {i}",
+            "startTimeGMT": started.strftime("%Y-%m-%d %H:%M:%S"),
+            "startTimeLocal": started.strftime("%Y-%m-%d %H:%M:%S"),
+            "activityType": {"typeKey": type_key},
+            "distance": distance,
+            "duration": duration,
+            "calories": rng.uniform(50, 1500),
+            "averageSpeed": distance / duration if distance else 0,
+            "avgPower": rng.choice([0, rng.uniform(100, 300)]),
+            "maxPower": rng.choice([0, rng.uniform(300, 900)]),
+            "trainingEffectLabel": rng.choice(["AEROBIC_BASE", "TEMPO", "RECOVERY", "VO2MAX"]),
+            "aerobicTrainingEffect": rng.uniform(0, 5),
+            "aerobicTrainingEffectMessage": rng.choice(["IMPROVING_AEROBIC_BASE_8", "MAINTAINING_AEROBIC_FITNESS_1"]),
+            "anaerobicTrainingEffect": rng.uniform(0, 5),
+            "anaerobicTrainingEffectMessage": rng.choice(["NO_ANAEROBIC_BENEFIT_0", "MINOR_ANAEROBIC_BENEFIT_1"]),
+            "pr": rng.random() < 0.02,
+            "favorite": rng.random() < 0.05,
+        })
+    return activities
+
+def make_personal_records(seed=0):
+    rng = random.Random(seed)
+    values = {1: 240, 2: 400, 3: 1300, 4: 2800, 7: 21000, 8: 80000, 9: 1200, 10: 250,
+              12: 30000, 13: 120000, 14: 400000, 15: 45, 16: 0}
+    return [
+        {
+            "typeId": type_id,
+            "value": value * rng.uniform(0.95, 1.05),
+            "activityType": "running" if type_id <= 7 else None,
+            "prStartTimeGmtFormatted": (FIXTURE_END - timedelta(days=rng.randrange(365))).isoformat(),
+        }
+        for type_id, value in values.items()
+    ]
+
+def make_daily_steps(day, rng):
+    return {
+        "calendarDate": day.isoformat(),
+        "totalSteps": rng.randrange(2000, 25000),
+        "stepGoal": 10000,
+        "totalDistance": rng.randrange(1500, 20000),
+    }
+
+def make_sleep(day, rng):
+    start = datetime.combine(day, datetime.min.time()) - timedelta(hours=rng.uniform(1, 3))
+    deep, light, rem, awake = (rng.randrange(1800, 7200), rng.randrange(7200, 14400),
+                               rng.randrange(1800, 7200), rng.randrange(0, 2400))
+    return {
+        "dailySleepDTO": {
+            "calendarDate": day.isoformat(),
+            "sleepStartTimestampGMT": int(start.timestamp() * 1000),
+            "sleepEndTimestampGMT": int((start + timedelta(seconds=deep + light + rem + awake)).timestamp() * 1000),
+            "deepSleepSeconds": deep,
+            "lightSleepSeconds": light,
+            "remSleepSeconds": rem,
+            "awakeSleepSeconds": awake,
+        },
+        "restingHeartRate": rng.randrange(40, 70),
+    }
+
+class FakeGarmin:
+    """
+    Replays Garmin payloads, either recorded with record.py or generated, and counts calls.
+
+    `latency` (seconds) is added to every call to mimic Garmin's response time.
+    """
+
+    def __init__(self, activities, personal_records=None, daily_steps=None, sleep=None, latency=0.0, seed=0):
+        self.activities = activities
+        self.personal_records = personal_records if personal_records is not None else make_personal_records(seed)
+        self.daily_steps = {s['calendarDate']: s for s in daily_steps or []}
+        self.sleep = {s['dailySleepDTO']['calendarDate']: s for s in sleep or [] if s.get('dailySleepDTO')}
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_fixtures(cls, directory, **kwargs):
+        """
+        Load payloads recorded by record.py (activities.json, personal_records.json,
+        daily_steps.json, sleep.json).
+        """
+        def load(name):
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                return None
+            with open(path) as f:
+                return json.load(f)
+        return cls(load("activities.json") or [], load("personal_records.json"),
+                   load("daily_steps.json"), load("sleep.json"), **kwargs)
+
+    def _call(self, name):
+        with self.lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_activities(self, start=0, limit=20):
+        self._call("get_activities")
+        return self.activities[start:start + limit]
+
+    def get_device_last_used(self):
+        self._call("get_device_last_used")
+        return {"lastUsedDeviceUploadTime": int(datetime.combine(FIXTURE_END, datetime.min.time()).timestamp() * 1000)}
+
+    def get_personal_record(self):
+        self._call("get_personal_record")
+        return self.personal_records
+
+    def get_daily_steps(self, start, end):
+        self._call("get_daily_steps")
+        day, end = date.fromisoformat(start), date.fromisoformat(end)
+        steps = []
+        while day <= end:
+            with self.lock:
+                steps.append(self.daily_steps.get(day.isoformat()) or make_daily_steps(day, self.rng))
+            day += timedelta(days=1)
+        return steps
+
+    def get_sleep_data(self, cdate):
+        self._call("get_sleep_data")
+        with self.lock:
+            return self.sleep.get(cdate) or make_sleep(date.fromisoformat(cdate), self.rng)
@@ -0,0 +1,212 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+import itertools
+import threading
+import random
+import json
+import time
+import uuid
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from notion_properties import property_value
+
+def to_response_property(prop):
+    """
+    Turn a property as sent by the scripts into the shape the Notion API returns.
+    """
+    kind = next(iter(prop))
+    value = prop[kind]
+    if kind in ('title', 'rich_text'):
+        value = [
+            {**part, "type": "text", "plain_text": part.get('text', {}).get('content', '')}
+            for part in value
+        ]
+    return {"id": uuid.uuid4().hex[:4], "type": kind, kind: value}
+
+def compare(kind, value, op, arg):
+    if kind == 'date':
+        value = value[0][:10] if value and value[0] else None
+        if value is None:
+            return op == 'is_empty'
+        return {
+            'equals': value == arg[:10],
+            'before': value < arg[:10],
+            'after': value > arg[:10],
+            'on_or_before': value <= arg[:10],
+            'on_or_after': value >= arg[:10],
+        }.get(op, False)
+    if op == 'equals':
+        return value == arg
+    if op == 'does_not_equal':
+        return value != arg
+    if op == 'contains':
+        return arg in (value or '')
+    if op == 'is_empty':
+        return value in (None, '')
+    if op == 'is_not_empty':
+        return value not in (None, '')
+    if op == 'greater_than':
+        return value is not None and value > arg
+    if op == 'less_than':
+        return value is not None and value < arg
+    return False
+
+def matches(page, flt):
+    """
+    Evaluate the subset of Notion database filters the sync scripts use.
+    """
+    if not flt:
+        return True
+    if 'and' in flt:
+        return all(matches(page, f) for f in flt['and'])
+    if 'or' in flt:
+        return any(matches(page, f) for f in flt['or'])
+    prop = page['properties'].get(flt['property'])
+    kind = next(key for key in flt if key != 'property')
+    op, arg = next(iter(flt[kind].items()))
+    return compare(kind, property_value(prop), op, arg)
+
+class MockNotion:
+    """
+    In-memory stand-in for the parts of the Notion API the sync scripts call:
+    database queries with cursor pagination, database property updates, page
+    creation and page updates.
+
+    `latency` (seconds) is added to every request and `rate_limit_every` makes
+    every Nth request answer 429 with a Retry-After header.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit_every=0, retry_after=0.1):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.pages = {}
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+        self.requests = Counter()
+        self.rate_limited = 0
+        self.server = None
+
+    def seed(self, database_id, properties):
+        """
+        Add an existing page, with properties in payload shape.
+        """
+        return self.create({"parent": {"database_id": database_id}, "properties": properties})
+
+    def create(self, body):
+        page = {
+            "object": "page",
+            "id": str(uuid.uuid4()),
+            "parent": body.get('parent', {}),
+            "properties": {name: to_response_property(prop) for name, prop in body.get('properties', {}).items()},
+            "icon": body.get('icon'),
+            "cover": body.get('cover'),
+        }
+        with self.lock:
+            self.pages[page['id']] = page
+        return page
+
+    def update(self, page_id, body):
+        with self.lock:
+            page = self.pages.get(page_id)
+            if page is None:
+                return None
+            for name, prop in body.get('properties', {}).items():
+                page['properties'][name] = to_response_property(prop)
+            for key in ('icon', 'cover'):
+                if key in body:
+                    page[key] = body[key]
+            return page
+
+    def query(self, database_id, body):
+        with self.lock:
+            pages = [
+                page for page in self.pages.values()
+                if page['parent'].get('database_id') == database_id and matches(page, body.get('filter'))
+            ]
+        start = int(body.get('start_cursor') or 0)
+        size = min(int(body.get('page_size') or 100), 100)
+        end = start + size
+        return {
+            "object": "list",
+            "results": pages[start:end],
+            "next_cursor": str(end) if end < len(pages) else None,
+            "has_more": end < len(pages),
+        }
+
+    def database_pages(self, database_id):
+        with self.lock:
+            return [page for page in self.pages.values() if page['parent'].get('database_id') == database_id]
+
+    def start(self):
+        handler = type("Handler", (_Handler,), {"notion": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Avoid Nagle/delayed-ACK stalls on kept-alive connections
+    disable_nagle_algorithm = True
+    notion = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_request(self, method):
+        notion = self.notion
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        parts = self.path.split('?')[0].strip('/').split('/')[1:]  # drop the "v1" prefix
+
+        if notion.latency or notion.jitter:
+            time.sleep(notion.latency + random.random() * notion.jitter)
+
+        route = f"{method} /{parts[0]}" + ("/query" if parts[-1] == "query" else "")
+        with notion.lock:
+            notion.requests[route] += 1
+            count = next(notion.counter)
+        if notion.rate_limit_every and count % notion.rate_limit_every == 0:
+            with notion.lock:
+                notion.rate_limited += 1
+            return self.send_json(429, {"object": "error", "status": 429, "code": "rate_limited",
+                                        "message": "Rate limited"}, {"Retry-After": str(notion.retry_after)})
+
+        if method == "POST" and parts[0] == "databases" and parts[-1] == "query":
+            return self.send_json(200, notion.query(parts[1], body))
+        if method == "POST" and parts == ["pages"]:
+            return self.send_json(200, notion.create(body))
+        if method == "PATCH" and parts[0] == "databases" and len(parts) == 2:
+            # Schema changes are accepted but not tracked, pages keep whatever properties they were given
+            return self.send_json(200, {"object": "database", "id": parts[1]})
+        if method == "PATCH" and parts[0] == "pages" and len(parts) == 2:
+            page = notion.update(parts[1], body)
+            if page:
+                return self.send_json(200, page)
+        self.send_json(404, {"object": "error", "status": 404, "code": "object_not_found",
+                             "message": f"Unknown route {method} {self.path}"})
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PATCH(self):
+        self.handle_request("PATCH")
@@ -0,0 +1,37 @@
+from datetime import date, timedelta
+from dotenv import load_dotenv
+import argparse
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from garmin_session import garmin_login
+
+def main():
+    parser = argparse.ArgumentParser(description="Record Garmin payloads for the offline benchmarks")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+    parser.add_argument("--activities", type=int, default=1000, help="number of activities to record")
+    parser.add_argument("--days", type=int, default=30, help="days of steps and sleep to record")
+    args = parser.parse_args()
+
+    load_dotenv()
+    garmin = garmin_login(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD"))
+
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=args.days - 1)
+    payloads = {
+        "activities.json": garmin.get_activities(0, args.activities),
+        "personal_records.json": garmin.get_personal_record(),
+        "daily_steps.json": garmin.get_daily_steps(start.isoformat(), end.isoformat()),
+        "sleep.json": [garmin.get_sleep_data((start + timedelta(days=x)).isoformat()) for x in range(args.days)],
+    }
+
+    os.makedirs(args.out, exist_ok=True)
+    for name, payload in payloads.items():
+        with open(os.path.join(args.out, name), "w") as f:
+            json.dump(payload, f)
+        print(f"Recorded {name}")
+
+if __name__ == '__main__':
+    main()
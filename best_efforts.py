@@ -0,0 +1,197 @@
+from datetime import datetime
+from garminconnect import Garmin
+import zipfile
+import io
+import os
+
+# NumPy and a FIT parser are optional, best efforts are only computed when they are installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import fitdecode
+except ImportError:
+    fitdecode = None
+try:
+    import fitparse
+except ImportError:
+    fitparse = None
+
+# Download FIT files of new activities and derive records from them (needs numpy and fitdecode or fitparse)
+FIT_EFFORTS = os.getenv("GARMIN_FIT_EFFORTS", "0") == "1"
+# FIT files downloaded per run, so a long history is backfilled over several runs
+FIT_MAX_DOWNLOADS = int(os.getenv("FIT_MAX_DOWNLOADS", 20))
+
+# Record name -> distance in meters, fastest time wins (running activities)
+DISTANCE_EFFORTS = {
+    "Fastest 1K": 1000,
+    "Fastest 5K": 5000,
+    "Fastest 10K": 10000,
+    "Fastest Half Marathon": 21097.5,
+}
+# Record name -> window in seconds, highest average power wins (cycling activities)
+POWER_EFFORTS = {
+    "Best 5 min Power": 300,
+    "Best 20 min Power": 1200,
+    "Best 60 min Power": 3600,
+}
+
+def fit_efforts_enabled():
+    return FIT_EFFORTS and np is not None and (fitdecode is not None or fitparse is not None)
+
+def effort_sport(activity):
+    type_key = activity.get('activityType', {}).get('typeKey', '')
+    if "running" in type_key:
+        return "Running"
+    if "cycling" in type_key or "biking" in type_key:
+        return "Cycling"
+    return None
+
+def fit_bytes(data):
+    # ORIGINAL downloads are a zip holding the .fit file
+    if data[:2] == b"PK":
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            name = next(name for name in archive.namelist() if name.lower().endswith(".fit"))
+            return archive.read(name)
+    return data
+
+def fit_records(data):
+    """
+    Yield the (timestamp, distance, power) of each record message of a FIT file.
+    """
+    data = fit_bytes(data)
+    if fitdecode is not None:
+        with fitdecode.FitReader(io.BytesIO(data)) as fit:
+            for frame in fit:
+                if frame.frame_type == fitdecode.FIT_FRAME_DATA and frame.name == "record":
+                    yield (frame.get_value("timestamp", fallback=None), frame.get_value("distance", fallback=None),
+                           frame.get_value("power", fallback=None))
+    else:
+        for message in fitparse.FitFile(data).get_messages("record"):
+            values = message.get_values()
+            yield values.get("timestamp"), values.get("distance"), values.get("power")
+
+def parse_fit(data):
+    """
+    Turn the record stream of a FIT file into arrays of seconds since the start,
+    distance in meters and power in watts (NaN where a sample has no value).
+    """
+    rows = [
+        (timestamp.timestamp() if isinstance(timestamp, datetime) else float(timestamp),
+         float("nan") if distance is None else float(distance),
+         float("nan") if power is None else float(power))
+        for timestamp, distance, power in fit_records(data) if timestamp is not None
+    ]
+    if not rows:
+        return None
+    samples = np.array(rows)
+    samples = samples[np.argsort(samples[:, 0], kind="stable")]
+    return {"time": samples[:, 0] - samples[0, 0], "distance": samples[:, 1], "power": samples[:, 2]}
+
+def fastest_distance(time, distance, meters):
+    # For every start sample, the first sample at least `meters` further on, in one searchsorted pass
+    end = np.searchsorted(distance, distance + meters)
+    valid = end < len(distance)
+    if not valid.any():
+        return None
+    return float((time[end[valid]] - time[valid]).min())
+
+def best_power(time, power, seconds):
+    # Highest average over any `seconds` window, from a cumulative sum of the 1 Hz power
+    if time[-1] - time[0] < seconds:
+        return None
+    grid = np.arange(time[0], time[-1] + 1)
+    cumulative = np.concatenate(([0.0], np.cumsum(np.interp(grid, time, power))))
+    return float(((cumulative[seconds:] - cumulative[:-seconds]) / seconds).max())
+
+def km_splits(time, distance):
+    # Seconds spent on each full kilometer
+    marks = np.arange(1000, distance[-1] + 1, 1000)
+    if not len(marks):
+        return []
+    times = np.interp(marks, distance, time)
+    return np.diff(np.concatenate(([time[0]], times))).round(1).tolist()
+
+def compute_efforts(streams, sport):
+    """
+    Best efforts and km splits of one activity, from the arrays of parse_fit().
+    """
+    efforts = {}
+    splits = []
+    has_distance = ~np.isnan(streams["distance"])
+    if sport == "Running" and has_distance.sum() > 1:
+        # Distance never decreases, which searchsorted and interp rely on
+        time = streams["time"][has_distance]
+        distance = np.maximum.accumulate(streams["distance"][has_distance])
+        for name, meters in DISTANCE_EFFORTS.items():
+            seconds = fastest_distance(time, distance, meters)
+            if seconds:
+                efforts[name] = seconds
+        splits = km_splits(time, distance)
+
+    has_power = ~np.isnan(streams["power"])
+    if sport == "Cycling" and has_power.sum() > 1:
+        for name, seconds in POWER_EFFORTS.items():
+            watts = best_power(streams["time"][has_power], streams["power"][has_power], seconds)
+            if watts:
+                efforts[name] = watts
+    return efforts, splits
+
+class BestEffortIndex:
+    """
+    Current best of every derived record, kept in the sync state so that each run
+    only looks at the activities that started after the last one it processed.
+    """
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.bests = dict(state.get("bests", {}))
+        self.processed_through = state.get("processed_through")
+
+    def add(self, activity, sport, efforts):
+        """
+        Merge one activity's efforts, returning the records it improved.
+        """
+        improved = []
+        for name, value in efforts.items():
+            best = self.bests.get(name)
+            faster = name in DISTANCE_EFFORTS
+            if best is None or (value < best["value"] if faster else value > best["value"]):
+                self.bests[name] = {"value": value, "activityId": activity.get('activityId'),
+                                    "date": activity.get('startTimeGMT'), "activity_type": sport}
+                improved.append(name)
+        self.processed_through = max(self.processed_through or "", activity.get('startTimeGMT') or "")
+        return improved
+
+    def to_state(self):
+        return {"bests": self.bests, "processed_through": self.processed_through}
+
+def pending_activities(mirror, index):
+    # Mirrored running and cycling activities that started after the last one analyzed, oldest first
+    return [
+        activity for activity in reversed(mirror.load_activities(index.processed_through))
+        if activity.get('startTimeGMT', '') > (index.processed_through or '') and effort_sport(activity)
+    ]
+
+def update_best_efforts(garmin, mirror, index, max_downloads=FIT_MAX_DOWNLOADS):
+    """
+    Download and analyze the FIT files of the mirrored activities newer than the index,
+    oldest first, and return the names of the records that improved. Efforts already
+    in the mirror (e.g. from a dry run) are reused instead of downloaded again.
+    """
+    improved = set()
+    known = mirror.load_best_efforts(index.processed_through)
+    pending = pending_activities(mirror, index)
+    for activity in pending[:max_downloads]:
+        sport = effort_sport(activity)
+        efforts = known.get(activity['activityId'], {}).get('efforts')
+        if efforts is None:
+            data = garmin.download_activity(activity['activityId'], dl_fmt=Garmin.ActivityDownloadFormat.ORIGINAL)
+            streams = parse_fit(data)
+            efforts, splits = compute_efforts(streams, sport) if streams else ({}, [])
+            mirror.save_best_efforts(activity, {"sport": sport, "efforts": efforts, "km_splits": splits})
+        improved.update(index.add(activity, sport, efforts))
+    if len(pending) > max_downloads:
+        print(f"Best efforts: {len(pending) - max_downloads} activities left for the next runs")
+    return improved
@@ -1,54 +1,59 @@
 from datetime import date, timedelta
-from garminconnect import Garmin
-from notion_client import Client
+from garmin_session import garmin_login
+from notion_client.helpers import iterate_paginated_api
+from notion_writer import NotionWriter, WriteCounts, make_notion_client, NOTION_MAX_WORKERS
+from instrumentation import instrument, report_metrics
+from notion_properties import changed_properties
+from garmin_mirror import GarminMirror
+from pipeline import pipeline
+from sync_plan import add_plan_arguments, run_planned, load_plan, execute_plan
+from sync_probe import probed, device_upload_time
+from sync_state import load_checkpoint, save_checkpoint, clear_checkpoint, CHECKPOINT_EVERY
 from dotenv import load_dotenv
+import argparse
+import sys
 import os
 
-def get_all_daily_steps(garmin):
+# Garmin returns at most 28 days of daily steps per request
+CHUNK_DAYS = 28
+# Chunks fetched from Garmin at the same time during a backfill
+GARMIN_MAX_WORKERS = int(os.getenv("GARMIN_MAX_WORKERS", 4))
+
+def date_chunks(start, end, chunk_days=CHUNK_DAYS):
     """
-    Get last x days of daily step count data from Garmin Connect.
+    Split the inclusive range start..end into consecutive ranges of at most chunk_days days.
     """
-    startdate = date.today() - timedelta(days=1)
-    daterange = [startdate + timedelta(days=x) 
-                 for x in range((date.today() - startdate).days)] # excl. today
-    daily_steps = []
-    for d in daterange:
-        daily_steps += garmin.get_daily_steps(d.isoformat(), d.isoformat())
-    return daily_steps
-
-def daily_steps_exist(client, database_id, activity_date):
+    while start <= end:
+        chunk_end = min(start + timedelta(days=chunk_days - 1), end)
+        yield start, chunk_end
+        start = chunk_end + timedelta(days=1)
+
+def get_daily_steps_index(client, database_id, start, end):
     """
-    Check if daily step count already exists in the Notion database.
+    Get the daily steps pages between start and end (inclusive), indexed by date.
     """
-    query = client.databases.query(
+    index = {}
+    for page in iterate_paginated_api(
+        client.databases.query,
         database_id=database_id,
+        page_size=100,
         filter={
             "and": [
-                {"property": "Date", "date": {"equals": activity_date}},
+                {"property": "Date", "date": {"on_or_after": start.isoformat()}},
+                {"property": "Date", "date": {"on_or_before": end.isoformat()}},
                 {"property": "Activity Type", "title": {"equals": "Walking"}}
             ]
         }
-    )
-    results = query['results']
-    return results[0] if results else None
-
-def steps_need_update(existing_steps, new_steps):
-    """
-    Compare existing steps data with imported data to determine if an update is needed.
-    """
-    existing_props = existing_steps['properties']
-    activity_type = "Walking"
-    
-    return (
-        existing_props['Total Steps']['number'] != new_steps.get('totalSteps') or
-        existing_props['Step Goal']['number'] != new_steps.get('stepGoal') or
-        existing_props['Total Distance (km)']['number'] != new_steps.get('totalDistance') or
-        existing_props['Activity Type']['title'] != activity_type
-    )
+    ):
+        date_prop = page['properties'].get('Date', {}).get('date') or {}
+        if date_prop.get('start'):
+            index.setdefault(date_prop['start'][:10], page)
+    return index
 
 def update_daily_steps(client, existing_steps, new_steps):
     """
-    Update an existing daily steps entry in the Notion database with new data.
+    Update an existing daily steps entry in the Notion database with the properties that changed.
+    Return None when nothing changed and no request was sent.
     """
     total_distance = new_steps.get('totalDistance')
     if total_distance is None:
@@ -62,10 +67,13 @@ def update_daily_steps(client, existing_steps, new_steps):
     
     update = {
         "page_id": existing_steps['id'],
-        "properties": properties,
+        "properties": changed_properties(existing_steps['properties'], properties),
     }
+
+    if not update["properties"]:
+        return None
         
-    client.pages.update(**update)
+    return client.pages.update(**update)
 
 def create_daily_steps(client, database_id, steps):
     """
@@ -87,9 +95,109 @@ def create_daily_steps(client, database_id, steps):
         "properties": properties,
     }
     
-    client.pages.create(**page)
+    return client.pages.create(**page)
+
+def probe(garmin):
+    # Change probe: new daily steps needs an upload from the watch, and the default range moves with the day
+    return {"upload": device_upload_time(garmin), "day": date.today().isoformat()}
+
+def sync(garmin, client, database_id, start=None, end=None, replay=False, resume=False):
+    """
+    Sync daily steps from start to end (inclusive, yesterday by default) using an already
+    authenticated Garmin session and Notion client. With replay, the steps come from the
+    local mirror instead of Garmin, by default for every day it holds. With resume, an
+    interrupted sync continues with the chunks of days it had not finished.
+    """
+    mirror = GarminMirror()
+    if replay and not (start or end):
+        # A replay without a range rebuilds every day in the mirror
+        start, end = mirror.date_range("daily_steps") or (None, None)
+    yesterday = date.today() - timedelta(days=1)
+    start = start or yesterday
+    end = end or yesterday
+
+    checkpoint = load_checkpoint('steps') if resume else None
+    done = set()
+    if checkpoint:
+        start, end = date.fromisoformat(checkpoint['start']), date.fromisoformat(checkpoint['end'])
+        done = set(checkpoint['done'])
+        print(f"Resuming daily steps {start} to {end}, {len(done)} chunks already synced")
+    elif resume:
+        print("No interrupted daily steps sync to resume")
+
+
+    def fetch(chunk):
+        chunk_start, chunk_end = chunk
+        if replay:
+            return chunk, mirror.load_daily_steps(chunk_start, chunk_end)
+        # One Garmin request per chunk of days
+        daily_steps = garmin.get_daily_steps(chunk_start.isoformat(), chunk_end.isoformat())
+        mirror.save_daily_steps(daily_steps)
+        return chunk, daily_steps
+
+    def read_existing(fetched):
+        (chunk_start, chunk_end), daily_steps = fetched
+        return chunk_start, daily_steps, get_daily_steps_index(client, database_id, chunk_start, chunk_end)
+
+    def save_progress():
+        # Record the chunks whose writes all went through; after a failed write the checkpoint stays put
+        client.flush()
+        mirror.save_pending()
+        if not client.dry_run and not client.failures:
+            save_checkpoint('steps', {"start": start.isoformat(), "end": end.isoformat(), "done": sorted(done)})
+
+    # Garmin fetches, Notion reads and Notion writes of different chunks overlap
+    chunks = pipeline(
+        (chunk for chunk in date_chunks(start, end) if chunk[0].isoformat() not in done),
+        (fetch, GARMIN_MAX_WORKERS),
+        (read_existing, NOTION_MAX_WORKERS),
+        maxsize=GARMIN_MAX_WORKERS
+    )
+
+    # Creates and updates are counted once Notion accepted them
+    writes = WriteCounts("created", "updated")
+    unchanged = 0
+    pending_days = 0
+    for chunk_start, daily_steps, existing_pages in chunks:
+        if pending_days >= CHECKPOINT_EVERY:
+            save_progress()
+            pending_days = 0
+        # Written or queued before the next checkpoint flushes
+        done.add(chunk_start.isoformat())
+        pending_days += len(daily_steps)
+        for steps in daily_steps:
+            steps_date = steps.get('calendarDate')
+            existing_steps = existing_pages.get(steps_date)
+            if existing_steps:
+                mirror.remember_page("daily_steps", steps_date, existing_steps)
+                result = update_daily_steps(client, existing_steps, steps)
+                if result is not None:
+                    writes.add("updated", result)
+                else:
+                    unchanged += 1
+            else:
+                page = create_daily_steps(client, database_id, steps)
+                mirror.remember_page("daily_steps", steps_date, page)
+                writes.add("created", page)
+
+    client.flush()
+    mirror.close()
+    if not client.dry_run and not client.failures:
+        clear_checkpoint('steps')
+    totals = writes.totals()
+    print(f"Daily steps: {totals['created']} created, {totals['updated']} updated, {unchanged} unchanged")
+    return {**totals, "unchanged": unchanged}
 
 def main():
+    parser = argparse.ArgumentParser(description="Sync Garmin daily steps to Notion")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, help="first day to sync (YYYY-MM-DD), default yesterday")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, help="last day to sync (YYYY-MM-DD), default yesterday")
+    parser.add_argument("--replay", action="store_true", help="use the steps saved in the local mirror instead of calling Garmin")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted sync from its last checkpoint")
+    parser.add_argument("--force", action="store_true", help="sync even when the change probe finds nothing new on Garmin")
+    add_plan_arguments(parser)
+    args = parser.parse_args()
+
     load_dotenv()
 
     # Initialize Garmin and Notion clients using environment variables
@@ -98,20 +206,25 @@ def main():
     notion_token = os.getenv("NOTION_TOKEN")
     database_id = os.getenv("NOTION_STEPS_DB_ID")
 
-    # Initialize Garmin client and login
-    garmin = Garmin(garmin_email, garmin_password)
-    garmin.login()
-    client = Client(auth=notion_token)
-
-    daily_steps = get_all_daily_steps(garmin)
-    for steps in daily_steps:
-        steps_date = steps.get('calendarDate')
-        existing_steps = daily_steps_exist(client, database_id, steps_date)
-        if existing_steps:
-            if steps_need_update(existing_steps, steps):
-                update_daily_steps(client, existing_steps, steps)
-        else:
-            create_daily_steps(client, database_id, steps)
+    # Initialize Garmin client, reusing the saved session when possible
+    garmin = None if args.replay or args.execute_plan else garmin_login(garmin_email, garmin_password)
+    notion = make_notion_client(notion_token)
+    garmin, metrics = instrument(garmin, notion)
+    client = NotionWriter(notion)
+
+    if args.execute_plan:
+        execute_plan(load_plan(args.execute_plan), client)
+    else:
+        # Explicit ranges are backfills, always run them
+        skip_probe = args.force or args.replay or args.resume or args.start or args.end
+        run_planned(args, client, "steps", database_id,
+                    probed("steps", lambda: probe(garmin),
+                           lambda client: sync(garmin, client, database_id, args.start, args.end, args.replay, args.resume),
+                           skip_probe))
+    client.close()
+    report_metrics(metrics)
+    if client.failures:
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
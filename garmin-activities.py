@@ -1,80 +1,73 @@
-from datetime import datetime, timezone
-from garminconnect import Garmin
-from notion_client import Client
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from garmin_session import garmin_login
+from notion_writer import NotionWriter, WriteCounts, make_notion_client
+from instrumentation import instrument, report_metrics
+from notion_properties import changed_properties, icon_changed, property_value
+from notion_client.helpers import iterate_paginated_api
 from dotenv import load_dotenv
+from sync_state import load_state, update_state, load_checkpoint, save_checkpoint, clear_checkpoint, Progress, CHECKPOINT_EVERY
+from garmin_mirror import GarminMirror
+from pipeline import pipeline, TRANSFORM_WORKERS
+from sync_plan import add_plan_arguments, run_planned, load_plan, execute_plan
+from activity_rules import get_classifier
+from sync_probe import probed, newest_activity_id
+import argparse
+import hashlib
+import json
 import pytz
+import sys
 import os
 
 # Your local time zone, replace with the appropriate one if needed
 local_tz = pytz.timezone('America/Toronto')
 
-ACTIVITY_ICONS = {
-    "Barre": "https://img.icons8.com/?size=100&id=66924&format=png&color=000000",
-    "Breathwork": "https://img.icons8.com/?size=100&id=9798&format=png&color=000000",
-    "Cardio": "https://img.icons8.com/?size=100&id=71221&format=png&color=000000",
-    "Cycling": "https://img.icons8.com/?size=100&id=47443&format=png&color=000000",
-    "Hiking": "https://img.icons8.com/?size=100&id=9844&format=png&color=000000",
-    "Indoor Cardio": "https://img.icons8.com/?size=100&id=62779&format=png&color=000000",
-    "Indoor Cycling": "https://img.icons8.com/?size=100&id=47443&format=png&color=000000",
-    "Indoor Rowing": "https://img.icons8.com/?size=100&id=71098&format=png&color=000000",
-    "Pilates": "https://img.icons8.com/?size=100&id=9774&format=png&color=000000",
-    "Meditation": "https://img.icons8.com/?size=100&id=9798&format=png&color=000000",
-    "Rowing": "https://img.icons8.com/?size=100&id=71491&format=png&color=000000",
-    "Running": "https://img.icons8.com/?size=100&id=k1l1XFkME39t&format=png&color=000000",
-    "Strength Training": "https://img.icons8.com/?size=100&id=107640&format=png&color=000000",
-    "Stretching": "https://img.icons8.com/?size=100&id=djfOcRn1m_kh&format=png&color=000000",
-    "Swimming": "https://img.icons8.com/?size=100&id=9777&format=png&color=000000",
-    "Treadmill Running": "https://img.icons8.com/?size=100&id=9794&format=png&color=000000",
-    "Walking": "https://img.icons8.com/?size=100&id=9807&format=png&color=000000",
-    "Yoga": "https://img.icons8.com/?size=100&id=9783&format=png&color=000000",
-    # Add more mappings as needed
-}
-
-def get_all_activities(garmin, limit=1000):
-    return garmin.get_activities(0, limit)
+# Days to re-check before the newest synced activity, to catch late edits
+LOOKBACK_DAYS = int(os.getenv("GARMIN_LOOKBACK_DAYS", 7))
 
-def format_activity_type(activity_type, activity_name=""):
-    # First format the activity type as before
-    formatted_type = activity_type.replace('_', ' ').title() if activity_type else "Unknown"
-
-    # Initialize subtype as the same as the main type
-    activity_subtype = formatted_type
-    activity_type = formatted_type
-
-    # Map of specific subtypes to their main types
-    activity_mapping = {
-        "Barre": "Strength",
-        "Indoor Cardio": "Cardio",
-        "Indoor Cycling": "Cycling",
-        "Indoor Rowing": "Rowing",
-        "Speed Walking": "Walking",
-        "Strength Training": "Strength",
-        "Treadmill Running": "Running"
-    }
+# Activities requested from Garmin per page
+PAGE_SIZE = int(os.getenv("GARMIN_PAGE_SIZE", 100))
 
-    # Special replacement for Rowing V2
-    if formatted_type == "Rowing V2":
-        activity_type = "Rowing"
-
-    # Special case for Yoga and Pilates
-    elif formatted_type in ["Yoga", "Pilates"]:
-        activity_type = "Yoga/Pilates"
-        activity_subtype = formatted_type
-
-    # If the formatted type is in our mapping, update both main type and subtype
-    if formatted_type in activity_mapping:
-        activity_type = activity_mapping[formatted_type]
-        activity_subtype = formatted_type
-
-    # Special cases for activity names
-    if activity_name and "meditation" in activity_name.lower():
-        return "Meditation", "Meditation"
-    if activity_name and "barre" in activity_name.lower():
-        return "Strength", "Barre"
-    if activity_name and "stretch" in activity_name.lower():
-        return "Stretching", "Stretching"
-    
-    return activity_type, activity_subtype
+def iter_activities(garmin, since=None, page_size=PAGE_SIZE, start=0):
+
+    # Yield activities newest first from the `start`th one, one page at a time, until Garmin
+    # has no more or until reaching ones started before `since`
+    while True:
+        page = garmin.get_activities(start, page_size)
+        if not page:
+            return
+        for activity in page:
+            if since and activity.get('startTimeGMT', '') < since:
+                return
+            yield activity
+        start += len(page)
+
+def get_sync_start(state, lookback_days=LOOKBACK_DAYS):
+
+    # Start from the newest synced activity minus the lookback window
+    last_start = state.get('activities', {}).get('startTimeGMT')
+    if not last_start:
+        return None
+    last_start = datetime.strptime(last_start, "%Y-%m-%d %H:%M:%S")
+    return (last_start - timedelta(days=lookback_days)).strftime("%Y-%m-%d %H:%M:%S")
+
+def update_sync_state(state, activities):
+
+    # Remember the newest activity seen so the next run can page forward from it
+    if not activities:
+        return state
+    newest = max(activities, key=lambda a: a.get('startTimeGMT', ''))
+    previous = state.get('activities', {})
+    if newest.get('startTimeGMT', '') >= previous.get('startTimeGMT', ''):
+        state['activities'] = {
+            "startTimeGMT": newest.get('startTimeGMT'),
+            "activityId": newest.get('activityId'),
+        }
+    return state
+
+def format_activity_type(activity_type, activity_name=""):
+    # Map the Garmin type and the activity name to (Activity Type, Subactivity Type), see activity_rules.json
+    return get_classifier().classify(activity_type, activity_name)
 
 def format_entertainment(activity_name):
     return activity_name.replace('ENTERTAINMENT', 'Netflix')
@@ -107,86 +100,95 @@ def format_pace(average_speed):
     else:
         return ""
     
-def activity_exists(client, database_id, activity_date, activity_type, activity_name):
-
-    # Check if an activity already exists in the Notion database and return it if found.
+def activity_key(activity_date, activity_type, activity_name):
 
-    # Handle the activity_type which is now a tuple
+    # Build the (date, Activity Type, Activity Name) key used to match activities with Notion pages
     if isinstance(activity_type, tuple):
         main_type, _ = activity_type
     else:
-        main_type = activity_type[0] if isinstance(activity_type, (list, tuple)) else activity_type
-    
-    # Determine the correct activity type for the lookup
+        main_type = activity_type
+
     lookup_type = "Stretching" if "stretch" in activity_name.lower() else main_type
-    
-    query = client.databases.query(
-        database_id=database_id,
-        filter={
-            "and": [
-                {"property": "Date", "date": {"equals": activity_date.split('T')[0]}},
-                {"property": "Activity Type", "select": {"equals": lookup_type}},
-                {"property": "Activity Name", "title": {"equals": activity_name}}
-            ]
-        }
-    )
-    results = query['results']
-    return results[0] if results else None
+    return (activity_date[:10], lookup_type, activity_name)
 
+def get_activity_index(client, database_id, since=None):
 
-def activity_needs_update(existing_activity, new_activity):
-    existing_props = existing_activity['properties']
-    
-    activity_name = new_activity.get('activityName', '').lower()
-    activity_type, activity_subtype = format_activity_type(
-        new_activity.get('activityType', {}).get('typeKey', 'Unknown'),
-        activity_name
-    )
-    
-    # Check if 'Subactivity Type' property exists
-    has_subactivity = (
-        'Subactivity Type' in existing_props and 
-        existing_props['Subactivity Type'] is not None and
-        existing_props['Subactivity Type'].get('select') is not None
-    )
-    
-    return (
-        existing_props['Distance (km)']['number'] != round(new_activity.get('distance', 0) / 1000, 2) or
-        existing_props['Duration (min)']['number'] != round(new_activity.get('duration', 0) / 60, 2) or
-        existing_props['Calories']['number'] != round(new_activity.get('calories', 0)) or
-        existing_props['Avg Pace']['rich_text'][0]['text']['content'] != format_pace(new_activity.get('averageSpeed', 0)) or
-        existing_props['Avg Power']['number'] != round(new_activity.get('avgPower', 0), 1) or
-        existing_props['Max Power']['number'] != round(new_activity.get('maxPower', 0), 1) or
-        existing_props['Training Effect']['select']['name'] != format_training_effect(new_activity.get('trainingEffectLabel', 'Unknown')) or
-        existing_props['Aerobic']['number'] != round(new_activity.get('aerobicTrainingEffect', 0), 1) or
-        existing_props['Aerobic Effect']['select']['name'] != format_training_message(new_activity.get('aerobicTrainingEffectMessage', 'Unknown')) or
-        existing_props['Anaerobic']['number'] != round(new_activity.get('anaerobicTrainingEffect', 0), 1) or
-        existing_props['Anaerobic Effect']['select']['name'] != format_training_message(new_activity.get('anaerobicTrainingEffectMessage', 'Unknown')) or
-        existing_props['PR']['checkbox'] != new_activity.get('pr', False) or
-        existing_props['Fav']['checkbox'] != new_activity.get('favorite', False) or
-        existing_props['Activity Type']['select']['name'] != activity_type or
-        (has_subactivity and existing_props['Subactivity Type']['select']['name'] != activity_subtype) or
-        (not has_subactivity)  # If the property doesn't exist, we need an update
-    )
+    # Page through the activities database once (from `since` if given) and index the pages by
+    # Activity ID, and the legacy pages that have no Activity ID yet by activity key
+    query = {"database_id": database_id, "page_size": 100}
+    if since:
+        query["filter"] = {"property": "Date", "date": {"on_or_after": since[:10]}}
+    by_id = {}
+    index = {}
+    for page in iterate_paginated_api(client.databases.query, **query):
+        props = page['properties']
+        activity_id = property_value(props.get('Activity ID'))
+        if activity_id is not None:
+            # Keep the first page of an id, later duplicates are left alone
+            by_id.setdefault(int(activity_id), page)
+            continue
+        date_prop = props.get('Date', {}).get('date') or {}
+        type_prop = props.get('Activity Type', {}).get('select') or {}
+        name = "".join(t.get('plain_text', '') for t in props.get('Activity Name', {}).get('title', []))
+        if not date_prop.get('start') or not type_prop.get('name'):
+            continue
+        # Keep the first match, like the filtered query did
+        index.setdefault((date_prop['start'][:10], type_prop['name'], name), page)
+    return by_id, index
 
-def create_activity(client, database_id, activity):
+def ensure_activity_id_property(client, database_id):
 
-    # Create a new activity in the Notion database
-    activity_date = activity.get('startTimeGMT')
-    activity_name = format_entertainment(activity.get('activityName', 'Unnamed Activity'))
-    activity_type, activity_subtype = format_activity_type(
+    # Add the Activity ID number property to the database, a no-op when it already exists
+    client.databases.update(database_id=database_id, properties={"Activity ID": {"number": {}}})
+
+def migrate_activity_ids(garmin, client, database_id):
+
+    # One-time backfill of Activity ID on pages created before it was the primary key,
+    # matching them with Garmin activities by date, type and name
+    ensure_activity_id_property(client, database_id)
+    _, legacy = get_activity_index(client, database_id)
+    backfilled = 0
+    if legacy:
+        oldest = min(activity_date for activity_date, _, _ in legacy)
+        for activity in iter_activities(garmin, since=oldest):
+            activity_name = format_entertainment(activity.get('activityName', 'Unnamed Activity'))
+            key = activity_key(activity.get('startTimeGMT'), classify_activity(activity), activity_name)
+            # Each legacy page is claimed once, so same-named sessions on one day get their own page
+            page = legacy.pop(key, None)
+            if page:
+                client.pages.update(page_id=page['id'], properties={"Activity ID": {"number": activity.get('activityId')}})
+                backfilled += 1
+            if not legacy:
+                break
+        client.flush()
+    if not client.dry_run:
+        update_state('activity_ids', {"migrated_at": datetime.now(timezone.utc).isoformat()})
+    print(f"Activity IDs: {backfilled} pages backfilled, {len(legacy)} without a matching Garmin activity")
+
+
+def classify_activity(activity):
+    return format_activity_type(
         activity.get('activityType', {}).get('typeKey', 'Unknown'),
-        activity_name
+        activity.get('activityName', 'Unnamed Activity')
     )
+
+def activity_properties(activity, classification=None):
+
+    # Build the Notion properties and icon URL that both new and updated activities get,
+    # name and date included so a renamed or moved activity is hashed and updated
+    activity_type, activity_subtype = classification or classify_activity(activity)
     
     # Get icon for the activity type
-    icon_url = ACTIVITY_ICONS.get(activity_subtype if activity_subtype != activity_type else activity_type)
+    icon_url = get_classifier().icon(activity_type, activity_subtype)
     
+    activity_name = format_entertainment(activity.get('activityName', 'Unnamed Activity'))
+
     properties = {
-        "Date": {"date": {"start": activity_date}},
+        "Date": {"date": {"start": activity.get('startTimeGMT')}},
+        "Activity Name": {"title": [{"text": {"content": activity_name}}]},
+        "Activity ID": {"number": activity.get('activityId')},
         "Activity Type": {"select": {"name": activity_type}},
         "Subactivity Type": {"select": {"name": activity_subtype}},
-        "Activity Name": {"title": [{"text": {"content": activity_name}}]},
         "Distance (km)": {"number": round(activity.get('distance', 0) / 1000, 2)},
         "Duration (min)": {"number": round(activity.get('duration', 0) / 60, 2)},
         "Calories": {"number": round(activity.get('calories', 0))},
@@ -201,6 +203,33 @@ def create_activity(client, database_id, activity):
         "PR": {"checkbox": activity.get('pr', False)},
         "Fav": {"checkbox": activity.get('favorite', False)}
     }
+    return properties, icon_url
+
+def activity_hash(activity, content=None):
+
+    # Stable hash of what an update would send, to skip unchanged activities without reading Notion
+    properties, icon_url = content or activity_properties(activity)
+    payload = json.dumps({"properties": properties, "icon": icon_url}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def prepare_activity(activity):
+
+    # Transform stage of the sync: everything the Notion stage needs that does not depend on Notion
+    # Classified once, then shared by the properties, the icon and the match key
+    activity_name = format_entertainment(activity.get('activityName', 'Unnamed Activity'))
+    activity_type = classify_activity(activity)
+    content = activity_properties(activity, activity_type)
+    return {
+        "activity": activity,
+        "content": content,
+        "hash": activity_hash(activity, content),
+        "key": activity_key(activity.get('startTimeGMT'), activity_type, activity_name),
+    }
+
+def create_activity(client, database_id, activity, content=None):
+
+    # Create a new activity in the Notion database
+    properties, icon_url = content or activity_properties(activity)
     
     page = {
         "parent": {"database_id": database_id},
@@ -210,49 +239,192 @@ def create_activity(client, database_id, activity):
     if icon_url:
         page["icon"] = {"type": "external", "external": {"url": icon_url}}
     
-    client.pages.create(**page)
+    return client.pages.create(**page)
     
-def update_activity(client, existing_activity, new_activity):
+def index_created_page(pages_by_activity, activity_id, page):
+    """
+    Index a page created in this run by its id only once the write finished, so the
+    responses of a long sync are not all kept in memory. A failed create is forgotten.
+    """
+    def keep_id(future):
+        result = None if future.exception() else future.result()
+        if result and result.get('id'):
+            pages_by_activity[activity_id] = {"id": result['id'], "properties": {}}
+        else:
+            pages_by_activity.pop(activity_id, None)
+
+    pages_by_activity[activity_id] = page
+    if isinstance(page, Future):
+        page.add_done_callback(keep_id)
+
+def update_activity(client, existing_activity, new_activity, content=None):
 
     # Update an existing activity in the Notion database with new data
-    activity_name = new_activity.get('activityName', 'Unnamed Activity')
-    activity_type, activity_subtype = format_activity_type(
-        new_activity.get('activityType', {}).get('typeKey', 'Unknown'),
-        activity_name
-    )
-    
-    # Get icon for the activity type
-    icon_url = ACTIVITY_ICONS.get(activity_subtype if activity_subtype != activity_type else activity_type)
-    
-    properties = {
-        "Activity Type": {"select": {"name": activity_type}},
-        "Subactivity Type": {"select": {"name": activity_subtype}},
-        "Distance (km)": {"number": round(new_activity.get('distance', 0) / 1000, 2)},
-        "Duration (min)": {"number": round(new_activity.get('duration', 0) / 60, 2)},
-        "Calories": {"number": round(new_activity.get('calories', 0))},
-        "Avg Pace": {"rich_text": [{"text": {"content": format_pace(new_activity.get('averageSpeed', 0))}}]},
-        "Avg Power": {"number": round(new_activity.get('avgPower', 0), 1)},
-        "Max Power": {"number": round(new_activity.get('maxPower', 0), 1)},
-        "Training Effect": {"select": {"name": format_training_effect(new_activity.get('trainingEffectLabel', 'Unknown'))}},
-        "Aerobic": {"number": round(new_activity.get('aerobicTrainingEffect', 0), 1)},
-        "Aerobic Effect": {"select": {"name": format_training_message(new_activity.get('aerobicTrainingEffectMessage', 'Unknown'))}},
-        "Anaerobic": {"number": round(new_activity.get('anaerobicTrainingEffect', 0), 1)},
-        "Anaerobic Effect": {"select": {"name": format_training_message(new_activity.get('anaerobicTrainingEffectMessage', 'Unknown'))}},
-        "PR": {"checkbox": new_activity.get('pr', False)},
-        "Fav": {"checkbox": new_activity.get('favorite', False)}
-    }
+    properties, icon_url = content or activity_properties(new_activity)
     
+    # Only send the properties (and icon) that actually changed
     update = {
         "page_id": existing_activity['id'],
-        "properties": properties,
+        "properties": changed_properties(existing_activity['properties'], properties),
     }
     
     if icon_url:
-        update["icon"] = {"type": "external", "external": {"url": icon_url}}
+        icon = {"type": "external", "external": {"url": icon_url}}
+        if icon_changed(existing_activity, icon):
+            update["icon"] = icon
+
+    if not update["properties"] and "icon" not in update:
+        return None
         
-    client.pages.update(**update)
+    return client.pages.update(**update)
+
+def probe(garmin):
+
+    # Change probe: a new activity shows up as a new newest activity id
+    return {"activityId": newest_activity_id(garmin)}
+
+def sync(garmin, client, database_id, full=False, lookback_days=LOOKBACK_DAYS, replay=False, resume=False):
+
+    # Get activities since the last run, or all of them on a full sync or a replay (which rebuilds from the whole mirror)
+    state = load_state()
+    since = None if full or replay else get_sync_start(state, lookback_days)
+
+    # A resumed run continues the interrupted one, with its window, after the activities it finished
+    checkpoint = load_checkpoint('activities') if resume else None
+    offset = 0
+    if checkpoint:
+        since, offset = checkpoint['since'], checkpoint['offset']
+        print(f"Resuming activities after the first {offset} (up to {checkpoint['before']})")
+    elif resume:
+        print("No interrupted activities sync to resume")
+
+    mirror = GarminMirror()
+    if replay:
+        # Rebuild from the local mirror without calling Garmin
+        activities = mirror.load_activities(since)[offset:]
+    else:
+        # Stream from Garmin so Notion work starts with the first page
+        activities = iter_activities(garmin, since, start=offset)
+    if checkpoint:
+        # Activities added since the interrupted run are left to the next regular run
+        activities = (a for a in activities if a.get('startTimeGMT', '') <= checkpoint['before'])
+
+    # Fetch, transform and Notion writes run as overlapping stages with bounded queues between them
+    prepared = pipeline(
+        enumerate(activities, offset),
+        (lambda pair: (pair[0], prepare_activity(pair[1])), TRANSFORM_WORKERS)
+    )
+
+    # Hash of what was last written for each activity; a replay may target a rebuilt database,
+    # and a full sync re-checks every page in case it was deleted or edited in Notion
+    page_hashes = {} if replay or full else mirror.page_hashes("activities")
+    activity_index = None
+
+    # Process all activities
+    # Creates and updates are counted once Notion accepted them
+    writes = WriteCounts("created", "updated")
+    unchanged = skipped = 0
+    newest = checkpoint and checkpoint['newest']
+    batch = []
+    progress = Progress(offset)
+
+    def save_progress():
+        # Record how far the sync got, once everything up to there is written
+        if batch:
+            mirror.save_activities(batch)
+            batch.clear()
+        client.flush()
+        mirror.save_pending()
+        if client.dry_run or client.failures or progress.last is None:
+            # After a failed write the checkpoint stays put so a resume retries it
+            return
+        save_checkpoint('activities', {
+            "since": since, "offset": progress.position, "before": progress.last.get('startTimeGMT'),
+            "newest": newest and {"startTimeGMT": newest.get('startTimeGMT'), "activityId": newest.get('activityId')},
+        })
+
+    for position, item in prepared:
+        if position > offset and (position - offset) % CHECKPOINT_EVERY == 0:
+            save_progress()
+        activity = item['activity']
+        # Every activity marked so far has been written or queued by the time the next checkpoint flushes
+        progress.mark(position, activity)
+        activity_id = activity.get('activityId')
+        if newest is None or activity.get('startTimeGMT', '') > newest.get('startTimeGMT', ''):
+            newest = activity
+        if not replay:
+            # Mirror in batches so memory stays flat however long the history is
+            batch.append(activity)
+            if len(batch) >= PAGE_SIZE:
+                mirror.save_activities(batch)
+                batch.clear()
+        content_hash = item['hash']
+
+        # Unchanged since it was last written: skip without reading Notion
+        page_id, stored_hash = page_hashes.get(activity_id, (None, None))
+        if page_id and stored_hash == content_hash:
+            skipped += 1
+            continue
+
+        if activity_index is None:
+            # Snapshot the Notion database once, and only if some activity changed
+            pages_by_activity, activity_index = get_activity_index(client, database_id, since)
+            pages_by_id = {page['id']: page for page in [*pages_by_activity.values(), *activity_index.values()]}
+            if not any('Activity ID' in page['properties'] for page in pages_by_id.values()):
+                # Empty database or one that predates Activity ID
+                ensure_activity_id_property(client, database_id)
+
+        # Check if activity already exists in Notion, by Activity ID first
+        # The page id remembered in the mirror still matches after a rename
+        # Legacy pages without an Activity ID fall back to the date/type/name key and get the id on update
+        existing_activity = (pages_by_activity.get(activity_id) or pages_by_id.get(page_id)
+                             or activity_index.pop(item['key'], None))
+        if isinstance(existing_activity, Future):
+            # Created earlier in this run, wait for the page to exist
+            existing_activity = existing_activity.result()
+        
+        if existing_activity:
+            result = update_activity(client, existing_activity, activity, item['content'])
+            if result is not None:
+                mirror.remember_page("activities", activity_id, result, content_hash)
+                writes.add("updated", result)
+                # print(f"Updated: {activity_type} - {activity_name}")
+            else:
+                mirror.remember_page("activities", activity_id, existing_activity, content_hash)
+                unchanged += 1
+        else:
+            page = create_activity(client, database_id, activity, item['content'])
+            mirror.remember_page("activities", activity_id, page, content_hash)
+            index_created_page(pages_by_activity, activity_id, page)
+            writes.add("created", page)
+            # print(f"Created: {activity_type} - {activity_name}")
+
+    if batch:
+        mirror.save_activities(batch)
+
+    # Only move the high-water mark once the writes have gone through
+    client.flush()
+    mirror.close()
+    totals = writes.totals()
+    created, updated = totals["created"], totals["updated"]
+    print(f"Activities: {created} created, {updated} updated, {unchanged} unchanged, {skipped} skipped by hash")
+    if not client.dry_run and not client.failures:
+        # After a failed write the next run starts from the same place, so it retries it
+        update_state('activities', update_sync_state(state, [newest] if newest else []).get('activities', {}))
+        clear_checkpoint('activities')
+    return {**totals, "unchanged": unchanged, "skipped": skipped}
 
 def main():
+    parser = argparse.ArgumentParser(description="Sync Garmin activities to Notion")
+    parser.add_argument("--full", action="store_true", help="ignore the saved state and re-sync the whole history")
+    parser.add_argument("--replay", action="store_true", help="use the activities saved in the local mirror instead of calling Garmin")
+    parser.add_argument("--migrate-ids", action="store_true", help="first backfill Activity ID on pages created before it existed (run once)")
+    parser.add_argument("--lookback-days", type=int, default=LOOKBACK_DAYS, help="days to re-check before the newest synced activity")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted sync from its last checkpoint")
+    parser.add_argument("--force", action="store_true", help="sync even when the change probe finds nothing new on Garmin")
+    add_plan_arguments(parser)
+    args = parser.parse_args()
+
     load_dotenv()
 
     # Initialize Garmin and Notion clients using environment variables
@@ -261,33 +433,25 @@ def main():
     notion_token = os.getenv("NOTION_TOKEN")
     database_id = os.getenv("NOTION_DB_ID")
 
-    # Initialize Garmin client and login
-    garmin = Garmin(garmin_email, garmin_password)
-    garmin.login()
-    client = Client(auth=notion_token)
-    
-    # Get all activities
-    activities = get_all_activities(garmin)
+    # Initialize Garmin client, reusing the saved session when possible
+    garmin = None if args.replay or args.execute_plan else garmin_login(garmin_email, garmin_password)
+    notion = make_notion_client(notion_token)
+    garmin, metrics = instrument(garmin, notion)
+    client = NotionWriter(notion)
 
-    # Process all activities
-    for activity in activities:
-        activity_date = activity.get('startTimeGMT')
-        activity_name = format_entertainment(activity.get('activityName', 'Unnamed Activity'))
-        activity_type, activity_subtype = format_activity_type(
-            activity.get('activityType', {}).get('typeKey', 'Unknown'),
-            activity_name
-        )
-        
-        # Check if activity already exists in Notion
-        existing_activity = activity_exists(client, database_id, activity_date, activity_type, activity_name)
-        
-        if existing_activity:
-            if activity_needs_update(existing_activity, activity):
-                update_activity(client, existing_activity, activity)
-                # print(f"Updated: {activity_type} - {activity_name}")
-        else:
-            create_activity(client, database_id, activity)
-            # print(f"Created: {activity_type} - {activity_name}")
+    if args.execute_plan:
+        execute_plan(load_plan(args.execute_plan), client)
+    else:
+        def run(client):
+            if args.migrate_ids:
+                migrate_activity_ids(garmin, client, database_id)
+            return sync(garmin, client, database_id, args.full, args.lookback_days, args.replay, args.resume)
+        skip_probe = args.force or args.full or args.replay or args.resume or args.migrate_ids
+        run_planned(args, client, "activities", database_id, probed("activities", lambda: probe(garmin), run, skip_probe))
+    client.close()
+    report_metrics(metrics)
+    if client.failures:
+        sys.exit(1)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
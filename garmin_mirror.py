@@ -0,0 +1,194 @@
+from concurrent.futures import Future
+from datetime import date, datetime, timezone
+import threading
+import sqlite3
+import json
+import os
+
+# Key column of each mirrored Garmin payload type
+TABLES = {
+    "activities": "activity_id INTEGER PRIMARY KEY",
+    "daily_steps": "calendar_date TEXT PRIMARY KEY",
+    "sleep": "calendar_date TEXT PRIMARY KEY",
+    "personal_records": "type_id INTEGER PRIMARY KEY",
+    # Best efforts and km splits computed from the FIT file of each activity
+    "best_efforts": "activity_id INTEGER PRIMARY KEY",
+}
+
+def get_mirror_file():
+    return os.getenv("GARMIN_MIRROR_FILE", "garmin-mirror.sqlite")
+
+class GarminMirror:
+    """
+    Local SQLite copy of the raw Garmin payloads and of the Notion page each one maps to.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_mirror_file()
+        # Stages may share the process with other threads, so the connection is guarded by a lock
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.pending = []
+        with self.lock, self.db:
+            for table, key in TABLES.items():
+                self.db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    f"{key}, sort_key TEXT, payload TEXT NOT NULL, notion_page_id TEXT, updated_at TEXT)"
+                )
+                self.db.execute(f"CREATE INDEX IF NOT EXISTS {table}_sort_key ON {table} (sort_key)")
+                # Columns added after the first release of the mirror
+                columns = {row[1] for row in self.db.execute(f"PRAGMA table_info({table})")}
+                if "notion_hash" not in columns:
+                    try:
+                        self.db.execute(f"ALTER TABLE {table} ADD COLUMN notion_hash TEXT")
+                    except sqlite3.OperationalError as e:
+                        # Another stage opening the same file added it first
+                        if "duplicate column" not in str(e):
+                            raise
+
+    def _key_column(self, table):
+        return TABLES[table].split()[0]
+
+    def save(self, table, items, key, sort_key):
+        """
+        Upsert payloads, keeping the Notion page id already known for each of them.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [(key(item), sort_key(item), json.dumps(item), now) for item in items]
+        column = self._key_column(table)
+        with self.lock, self.db:
+            self.db.executemany(
+                f"INSERT INTO {table} ({column}, sort_key, payload, updated_at) VALUES (?, ?, ?, ?) "
+                f"ON CONFLICT({column}) DO UPDATE SET sort_key = excluded.sort_key, "
+                f"payload = excluded.payload, updated_at = excluded.updated_at "
+                f"WHERE payload != excluded.payload",
+                rows
+            )
+
+    def load(self, table, start=None, end=None, newest_first=False):
+        """
+        Return the mirrored payloads, optionally limited to a sort key range (inclusive).
+        """
+        query = f"SELECT payload FROM {table} WHERE 1 = 1"
+        params = []
+        if start is not None:
+            query += " AND sort_key >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND sort_key <= ?"
+            params.append(end)
+        query += f" ORDER BY sort_key {'DESC' if newest_first else 'ASC'}"
+        with self.lock:
+            return [json.loads(row[0]) for row in self.db.execute(query, params)]
+
+    def load_changed(self, table, since=None):
+        """
+        Return the payloads whose content changed after the given updated_at (all of them without one).
+        """
+        query = f"SELECT payload FROM {table}"
+        params = []
+        if since is not None:
+            query += " WHERE updated_at > ?"
+            params.append(since)
+        with self.lock:
+            return [json.loads(row[0]) for row in self.db.execute(query, params)]
+
+    def date_range(self, table):
+        """
+        First and last calendar date mirrored in a table keyed by date, or None if it is empty.
+        """
+        with self.lock:
+            first, last = self.db.execute(f"SELECT MIN(sort_key), MAX(sort_key) FROM {table}").fetchone()
+        return (date.fromisoformat(first[:10]), date.fromisoformat(last[:10])) if first else None
+
+    def last_updated(self, tables=None):
+        # Latest content change across the given tables (all of them by default)
+        with self.lock:
+            return max(
+                (self.db.execute(f"SELECT MAX(updated_at) FROM {table}").fetchone()[0] or "" for table in tables or TABLES),
+                default=""
+            ) or None
+
+    def set_page_id(self, table, key, page_id, content_hash=None):
+        column = self._key_column(table)
+        with self.lock, self.db:
+            self.db.execute(
+                f"UPDATE {table} SET notion_page_id = ?, notion_hash = ? WHERE {column} = ?",
+                (page_id, content_hash, key)
+            )
+
+    def page_ids(self, table):
+        column = self._key_column(table)
+        with self.lock:
+            return dict(self.db.execute(
+                f"SELECT {column}, notion_page_id FROM {table} WHERE notion_page_id IS NOT NULL"
+            ))
+
+    def page_hashes(self, table):
+        """
+        Map each key to its Notion page id and the hash of the content last written there.
+        """
+        column = self._key_column(table)
+        with self.lock:
+            return {
+                key: (page_id, content_hash) for key, page_id, content_hash in self.db.execute(
+                    f"SELECT {column}, notion_page_id, notion_hash FROM {table} WHERE notion_page_id IS NOT NULL"
+                )
+            }
+
+    def remember_page(self, table, key, page, content_hash=None):
+        """
+        Store the page id of a Notion create/update result, with the hash of what was written.
+        Results still pending on the Notion writer are stored when the mirror is closed,
+        and only if the write succeeded.
+        """
+        if isinstance(page, Future):
+            self.pending.append((table, key, page, content_hash))
+        elif page and page.get('id'):
+            self.set_page_id(table, key, page['id'], content_hash)
+
+    def save_pending(self):
+        pending, self.pending = self.pending, []
+        for table, key, future, content_hash in pending:
+            if future.exception() is None:
+                self.remember_page(table, key, future.result(), content_hash)
+
+    # Payload-specific helpers
+
+    def save_activities(self, activities):
+        self.save("activities", activities, lambda a: a.get('activityId'), lambda a: a.get('startTimeGMT'))
+
+    def load_activities(self, since=None):
+        return self.load("activities", start=since, newest_first=True)
+
+    def save_daily_steps(self, daily_steps):
+        self.save("daily_steps", daily_steps, lambda s: s.get('calendarDate'), lambda s: s.get('calendarDate'))
+
+    def load_daily_steps(self, start, end):
+        return self.load("daily_steps", start.isoformat(), end.isoformat())
+
+    def save_sleep(self, sleep_data):
+        sleep_data = [data for data in sleep_data if data and data.get('dailySleepDTO', {}).get('calendarDate')]
+        self.save("sleep", sleep_data,
+                  lambda d: d['dailySleepDTO']['calendarDate'], lambda d: d['dailySleepDTO']['calendarDate'])
+
+    def load_sleep(self, start, end):
+        return self.load("sleep", start.isoformat(), end.isoformat())
+
+    def save_personal_records(self, records):
+        self.save("personal_records", records, lambda r: r.get('typeId'), lambda r: r.get('prStartTimeGmtFormatted'))
+
+    def load_personal_records(self):
+        return self.load("personal_records")
+
+    def save_best_efforts(self, activity, efforts):
+        payload = {"activityId": activity.get('activityId'), "startTimeGMT": activity.get('startTimeGMT'), **efforts}
+        self.save("best_efforts", [payload], lambda e: e['activityId'], lambda e: e['startTimeGMT'])
+
+    def load_best_efforts(self, since=None):
+        return {efforts['activityId']: efforts for efforts in self.load("best_efforts", start=since)}
+
+    def close(self):
+        self.save_pending()
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,60 @@
+from garminconnect import (
+    Garmin,
+    GarminConnectAuthenticationError,
+    GarminConnectConnectionError,
+)
+from garth.exc import GarthException
+from pathlib import Path
+import os
+
+# Where the Garmin session is saved when GARMINTOKENS is not set
+DEFAULT_TOKENSTORE = "~/.garminconnect"
+
+def get_tokenstore():
+    # GARMINTOKENS holds a directory or the session itself as a base64 blob
+    return os.getenv("GARMINTOKENS") or DEFAULT_TOKENSTORE
+
+def is_token_blob(tokenstore):
+    # Same rule garminconnect uses to tell an encoded session from a path
+    return len(tokenstore) > 512
+
+def garmin_login(email, password, tokenstore=None):
+    """
+    Resume the saved Garmin session if possible, otherwise log in with email and password
+    and save the new session for the next run.
+    """
+    tokenstore = tokenstore or get_tokenstore()
+    garmin = Garmin(email, password)
+    try:
+        # garth refreshes the OAuth2 token from the saved OAuth1 token when it has expired
+        garmin.login(tokenstore)
+        return garmin
+    except (FileNotFoundError, ValueError, GarthException,
+            GarminConnectAuthenticationError, GarminConnectConnectionError) as e:
+        print(f"Saved Garmin session unusable ({e.__class__.__name__}), logging in with credentials")
+
+    garmin = Garmin(email, password)
+    login_with_credentials(garmin)
+    save_garmin_session(garmin, tokenstore)
+    return garmin
+
+def login_with_credentials(garmin):
+    # Without a tokenstore, garminconnect falls back to GARMINTOKENS and would retry the
+    # unusable session instead of logging in, so hide it for the password login
+    saved = os.environ.pop("GARMINTOKENS", None)
+    try:
+        garmin.login()
+    finally:
+        if saved is not None:
+            os.environ["GARMINTOKENS"] = saved
+
+def save_garmin_session(garmin, tokenstore=None):
+    """
+    Save the current Garmin tokens, unless the session was given as an encoded blob.
+    """
+    tokenstore = tokenstore or get_tokenstore()
+    if is_token_blob(tokenstore):
+        return
+    path = Path(tokenstore).expanduser()
+    path.mkdir(parents=True, exist_ok=True)
+    garmin.garth.dump(str(path))
@@ -0,0 +1,193 @@
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+from collections import defaultdict
+import threading
+import json
+import time
+import os
+
+def percentile(values, pct):
+    # Nearest-rank percentile of an already sorted list
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, round(pct / 100 * len(values) + 0.5) - 1))
+    return values[rank]
+
+def payload_size(payload):
+    # Approximate bytes on the wire from the JSON payload
+    if payload is None:
+        return 0
+    try:
+        return len(json.dumps(payload, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+class Metrics:
+    """
+    Per-endpoint call counts, latencies, errors and bytes for one run.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.retries = defaultdict(int)
+        self.bytes_sent = defaultdict(int)
+        self.bytes_received = defaultdict(int)
+
+    def reset(self):
+        # Start a new reporting period, e.g. each cycle of a long-running daemon
+        with self.lock:
+            self.started = time.monotonic()
+            for values in (self.latencies, self.errors, self.retries, self.bytes_sent, self.bytes_received):
+                values.clear()
+
+    def record(self, endpoint, seconds, sent=0, received=0, error=None):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.bytes_sent[endpoint] += sent
+            self.bytes_received[endpoint] += received
+            if error is not None:
+                self.errors[endpoint] += 1
+                # Rate limits, server errors and timeouts are retried by the Notion writer
+                if isinstance(error, RequestTimeoutError) or (
+                        isinstance(error, HTTPResponseError) and (error.status == 429 or error.status >= 500)):
+                    self.retries[endpoint] += 1
+
+    def summary(self):
+        """
+        Build the structured run summary.
+        """
+        wall = time.monotonic() - self.started
+        endpoints = {}
+        with self.lock:
+            for endpoint, latencies in sorted(self.latencies.items()):
+                latencies = sorted(latencies)
+                total = sum(latencies)
+                endpoints[endpoint] = {
+                    "calls": len(latencies),
+                    "errors": self.errors[endpoint],
+                    "retries": self.retries[endpoint],
+                    "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                    "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                    "max_ms": round(latencies[-1] * 1000, 1),
+                    "total_seconds": round(total, 3),
+                    # Calls overlap when they run concurrently, so shares can add up to more than 1
+                    "wall_share": round(total / wall, 3) if wall else 0.0,
+                    "bytes_sent": self.bytes_sent[endpoint],
+                    "bytes_received": self.bytes_received[endpoint],
+                }
+        return {"wall_seconds": round(wall, 3), "endpoints": endpoints}
+
+    def to_prometheus(self, summary=None):
+        """
+        Render the summary in the Prometheus text exposition format.
+        """
+        summary = summary or self.summary()
+        metrics = [
+            ("garmin_notion_calls_total", "counter", "calls", "Requests per endpoint"),
+            ("garmin_notion_errors_total", "counter", "errors", "Failed requests per endpoint"),
+            ("garmin_notion_retries_total", "counter", "retries", "Retryable failures per endpoint"),
+            ("garmin_notion_latency_p50_ms", "gauge", "p50_ms", "Median latency in milliseconds"),
+            ("garmin_notion_latency_p95_ms", "gauge", "p95_ms", "95th percentile latency in milliseconds"),
+            ("garmin_notion_latency_max_ms", "gauge", "max_ms", "Maximum latency in milliseconds"),
+            ("garmin_notion_bytes_sent_total", "counter", "bytes_sent", "Approximate request bytes"),
+            ("garmin_notion_bytes_received_total", "counter", "bytes_received", "Approximate response bytes"),
+        ]
+        lines = []
+        for name, kind, key, help_text in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for endpoint, values in summary["endpoints"].items():
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {values[key]}')
+        lines.append("# HELP garmin_notion_run_seconds Wall time of the run")
+        lines.append("# TYPE garmin_notion_run_seconds gauge")
+        lines.append(f"garmin_notion_run_seconds {summary['wall_seconds']}")
+        return "\n".join(lines) + "\n"
+
+class InstrumentedGarmin:
+    """
+    Proxy for a Garmin client that times every API method call.
+    """
+
+    def __init__(self, garmin, metrics):
+        self._garmin = garmin
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._garmin, name)
+        # Only API methods are timed, classes such as Garmin.ActivityDownloadFormat pass through
+        if not callable(attr) or isinstance(attr, type) or name.startswith('_'):
+            return attr
+
+        def timed(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self._metrics.record(f"garmin.{name}", time.monotonic() - started, error=e)
+                raise
+            received = len(result) if isinstance(result, (bytes, bytearray)) else payload_size(result)
+            self._metrics.record(f"garmin.{name}", time.monotonic() - started, received=received)
+            return result
+        return timed
+
+def notion_endpoint(path, method):
+    # Name endpoints like the client methods, e.g. notion.databases.query or notion.pages.update
+    parts = path.strip('/').split('/')
+    if parts[0] == "databases" and parts[-1] == "query":
+        return "notion.databases.query"
+    if parts[0] == "pages":
+        if method == "POST":
+            return "notion.pages.create"
+        return "notion.pages.update" if method == "PATCH" else "notion.pages.retrieve"
+    return f"notion.{parts[0]}.{method.lower()}"
+
+def instrument_notion(client, metrics):
+    """
+    Time every request a notion_client.Client sends.
+    """
+    request = client.request
+
+    def timed(path, method, query=None, body=None, auth=None):
+        endpoint = notion_endpoint(path, method)
+        started = time.monotonic()
+        try:
+            result = request(path, method, query=query, body=body, auth=auth)
+        except Exception as e:
+            metrics.record(endpoint, time.monotonic() - started, payload_size(body), error=e)
+            raise
+        metrics.record(endpoint, time.monotonic() - started, payload_size(body), payload_size(result))
+        return result
+
+    client.request = timed
+    return client
+
+def instrument(garmin, notion_client, metrics=None):
+    """
+    Wrap the Garmin and Notion clients of a run, returning the Garmin proxy and the metrics.
+    """
+    metrics = metrics or Metrics()
+    instrument_notion(notion_client, metrics)
+    return InstrumentedGarmin(garmin, metrics), metrics
+
+def report_metrics(metrics):
+    """
+    Print the run summary and write it to SYNC_METRICS_FILE (JSON) and
+    SYNC_METRICS_PROM (Prometheus text) when those are set.
+    """
+    summary = metrics.summary()
+    print(f"Run summary ({summary['wall_seconds']:.1f}s):")
+    for endpoint, values in summary["endpoints"].items():
+        print(f"  {endpoint}: {values['calls']} calls, p50 {values['p50_ms']}ms, p95 {values['p95_ms']}ms, "
+              f"max {values['max_ms']}ms, {values['retries']} retries, {values['wall_share']:.0%} of wall time")
+
+    json_path = os.getenv("SYNC_METRICS_FILE")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+    prometheus_path = os.getenv("SYNC_METRICS_PROM")
+    if prometheus_path:
+        with open(prometheus_path, "w") as f:
+            f.write(metrics.to_prometheus(summary))
+    return summary
@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+
+def property_value(prop):
+    """
+    Reduce a Notion property, either as sent in a payload or as returned by the API,
+    to a plain value that can be compared.
+    """
+    if not prop:
+        return None
+    kind = prop.get('type') or next((key for key in prop if key != 'id'), None)
+    value = prop.get(kind)
+    if kind in ('title', 'rich_text'):
+        return "".join(
+            part.get('plain_text') or part.get('text', {}).get('content', '')
+            for part in value or []
+        )
+    if kind == 'select':
+        return value.get('name') if value else None
+    if kind == 'date':
+        return (normalize_date(value.get('start')), normalize_date(value.get('end'))) if value else None
+    return value
+
+def normalize_date(value):
+    """
+    Reduce a date or date-time to a comparable form: Notion answers a start sent as
+    "2024-01-01 10:00:00" with "2024-01-01T10:00:00.000+00:00".
+    """
+    if not value or len(value) <= 10:
+        return value
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return value
+    # Date-times without an offset are UTC in Notion
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+def changed_properties(existing_props, new_props):
+    """
+    Return only the properties of `new_props` whose value differs from the existing page.
+    """
+    return {
+        name: prop for name, prop in new_props.items()
+        if name not in existing_props or property_value(existing_props[name]) != property_value(prop)
+    }
+
+def icon_changed(existing_page, icon):
+    """
+    Tell whether the page icon differs from the one we would set.
+    """
+    existing_icon = existing_page.get('icon') or {}
+    if icon.get('type') == 'external':
+        return existing_icon.get('external', {}).get('url') != icon['external']['url']
+    return existing_icon.get('emoji') != icon.get('emoji')
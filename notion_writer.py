@@ -0,0 +1,251 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from notion_client import Client
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+import httpx
+import random
+import threading
+import time
+import os
+
+# Notion allows an average of ~3 requests per second per integration
+NOTION_RATE_LIMIT = float(os.getenv("NOTION_RATE_LIMIT", 3))
+NOTION_MAX_WORKERS = int(os.getenv("NOTION_MAX_WORKERS", 3))
+# Queued writes before submitting a new one blocks the caller
+NOTION_MAX_PENDING = int(os.getenv("NOTION_MAX_PENDING", 100))
+MAX_RETRIES = 5
+
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread talking to Notion.
+    """
+
+    def __init__(self, rate=NOTION_RATE_LIMIT, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.paused_until - now
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        # Hold back every worker, e.g. after Notion answered with Retry-After
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+def is_retryable(error):
+    if isinstance(error, RequestTimeoutError):
+        return True
+    return isinstance(error, HTTPResponseError) and (error.status == 429 or error.status >= 500)
+
+def retry_delay(error, attempt):
+    # Honor Retry-After when Notion sends it, otherwise back off exponentially with jitter
+    retry_after = error.headers.get("Retry-After") if isinstance(error, HTTPResponseError) else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(60, 2 ** attempt) * (0.5 + random.random() / 2)
+
+def call_with_retry(func, limiter=None, max_retries=MAX_RETRIES, on_retry=None, **kwargs):
+    """
+    Call a Notion endpoint under the rate limiter, retrying 429, 5xx and timeouts.
+    """
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        try:
+            return func(**kwargs)
+        except (HTTPResponseError, RequestTimeoutError) as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            attempt += 1
+            if on_retry:
+                on_retry(e, delay)
+            if limiter:
+                limiter.pause(delay)
+            else:
+                time.sleep(delay)
+
+def make_notion_client(auth, max_workers=NOTION_MAX_WORKERS, **options):
+    """
+    Build a notion_client.Client on one keep-alive connection pool, sized for the writer's
+    workers plus as many concurrent database queries, and on HTTP/2 when h2 is installed
+    (disable with NOTION_HTTP2=0).
+    """
+    connections = 2 * max_workers + 1
+    http = httpx.Client(
+        http2=HTTP2_AVAILABLE and os.getenv("NOTION_HTTP2", "1") != "0",
+        limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections, keepalive_expiry=30),
+    )
+    return Client(client=http, auth=auth, **options)
+
+class _Endpoint:
+    def __init__(self, writer, endpoint, asynchronous):
+        self.writer = writer
+        self.endpoint = endpoint
+        self.asynchronous = asynchronous
+
+    def __getattr__(self, name):
+        func = getattr(self.endpoint, name)
+        if self.asynchronous:
+            return lambda **kwargs: self.writer.submit(func, **kwargs)
+        return lambda **kwargs: self.writer.call(func, **kwargs)
+
+class WriteCounts:
+    """
+    Writes of one sync by kind ("created", "updated"), each counted once its future
+    finished without an error, so failed writes are not reported as done.
+    """
+
+    def __init__(self, *kinds):
+        self.counts = dict.fromkeys(kinds, 0)
+        self.pending = 0
+        self.finished = threading.Condition()
+
+    def add(self, kind, write):
+        with self.finished:
+            self.pending += 1
+        write.add_done_callback(lambda future: self._done(kind, future))
+        return write
+
+    def _done(self, kind, future):
+        with self.finished:
+            self.pending -= 1
+            if not future.cancelled() and future.exception() is None:
+                self.counts[kind] += 1
+            self.finished.notify_all()
+
+    def totals(self):
+        """
+        Wait for the counted writes to finish and return the counts.
+        """
+        with self.finished:
+            self.finished.wait_for(lambda: not self.pending)
+            return dict(self.counts)
+
+class NotionWriter:
+    """
+    Rate-limited front for a notion_client.Client.
+
+    `pages` calls are queued on a thread pool and return futures, while
+    `databases` calls run synchronously; both share one rate limiter and
+    retry 429/5xx responses. At most `max_pending` writes wait in the queue,
+    so a fast producer is held back instead of buffering its whole backlog.
+    Writers using the same integration token can share a `limiter`.
+    """
+
+    # Writes are sent, see sync_plan.PlanRecorder for the --dry-run counterpart
+    dry_run = False
+
+    def __init__(self, client, max_workers=NOTION_MAX_WORKERS, rate=NOTION_RATE_LIMIT,
+                 max_pending=NOTION_MAX_PENDING, limiter=None):
+        self.client = client
+        self.limiter = limiter or RateLimiter(rate)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.slots = threading.BoundedSemaphore(max(max_pending, max_workers))
+        self.pages = _Endpoint(self, client.pages, asynchronous=True)
+        self.databases = _Endpoint(self, client.databases, asynchronous=False)
+        # Only writes still pending, so finished responses are not kept for the whole run
+        self.futures = set()
+        self.lock = threading.Lock()
+        self.finished = threading.Condition(self.lock)
+        self.started = time.monotonic()
+        self.writes = 0
+        self.requests = 0
+        self.retries = 0
+        # Failed writes since the writer was created or reset_failures() was last called
+        self.failures = 0
+        self.failed = 0
+
+    def _on_retry(self, error, delay):
+        with self.lock:
+            self.retries += 1
+
+    def call(self, func, **kwargs):
+        with self.lock:
+            self.requests += 1
+        return call_with_retry(func, self.limiter, on_retry=self._on_retry, **kwargs)
+
+    def _done(self, future):
+        self.slots.release()
+        error = future.exception()
+        with self.lock:
+            if error:
+                self.failures += 1
+            self.futures.discard(future)
+            self.finished.notify_all()
+        if error:
+            print(f"Error writing to Notion: {error}")
+
+    def submit(self, func, **kwargs):
+        self.slots.acquire()
+        future = self.executor.submit(self.call, func, **kwargs)
+        with self.lock:
+            self.futures.add(future)
+            self.writes += 1
+        # Registered once tracked, so a write that already finished is still discarded
+        future.add_done_callback(self._done)
+        return future
+
+    def reset_failures(self):
+        """
+        Count failed writes from zero again, so a long-running process that hit one failure
+        can save its progress on the next successful cycle.
+        """
+        with self.lock:
+            self.failed += self.failures
+            self.failures = 0
+
+    def flush(self):
+        """
+        Block until every write queued so far has finished.
+        """
+        with self.lock:
+            futures = set(self.futures)
+        wait(futures)
+        # Done callbacks run after wait() returns, so also wait for them to count the failures
+        with self.finished:
+            self.finished.wait_for(lambda: not futures & self.futures)
+
+    def close(self):
+        """
+        Wait for queued writes to finish and report throughput.
+        """
+        self.flush()
+        self.executor.shutdown()
+        elapsed = time.monotonic() - self.started
+        rate = self.requests / elapsed if elapsed else 0
+        print(f"Notion: {self.requests} requests ({self.writes} writes, {self.failed + self.failures} failed, "
+              f"{self.retries} retries) in {elapsed:.1f}s, {rate:.2f} req/s")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
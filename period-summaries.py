@@ -0,0 +1,229 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from notion_client.helpers import iterate_paginated_api
+from notion_writer import NotionWriter, WriteCounts, make_notion_client
+from instrumentation import instrument, report_metrics
+from notion_properties import changed_properties
+from activity_rules import get_classifier
+from garmin_mirror import GarminMirror
+from sync_plan import add_plan_arguments, run_planned, load_plan, execute_plan
+from sync_probe import probed
+from sync_state import load_state, update_state
+from dotenv import load_dotenv
+import argparse
+import sys
+import os
+
+# Mirror tables the summaries are computed from
+SOURCE_TABLES = ("daily_steps", "sleep", "activities")
+
+def steps_day(steps):
+    return steps.get('calendarDate')
+
+def sleep_day(sleep_data):
+    return (sleep_data.get('dailySleepDTO') or {}).get('calendarDate')
+
+def activity_day(activity):
+    # Activities count towards the day they started on the watch
+    return (activity.get('startTimeLocal') or activity.get('startTimeGMT') or '')[:10] or None
+
+def periods_of(day):
+    """
+    The week (Monday to Sunday) and the month holding a day, as (type, name, start, end).
+    """
+    year, week, _ = day.isocalendar()
+    monday = day - timedelta(days=day.weekday())
+    month_start = day.replace(day=1)
+    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return [
+        ("Week", f"{year}-W{week:02d}", monday, monday + timedelta(days=6)),
+        ("Month", month_start.strftime("%Y-%m"), month_start, month_end),
+    ]
+
+def touched_periods(mirror, since=None):
+    """
+    The periods holding a day whose steps, sleep or activities changed in the mirror after `since`.
+    """
+    days = set()
+    for table, day_of in zip(SOURCE_TABLES, (steps_day, sleep_day, activity_day)):
+        days.update(day_of(item) for item in mirror.load_changed(table, since))
+    days.discard(None)
+    return sorted({period for day in days for period in periods_of(date.fromisoformat(day))}, key=lambda p: (p[2], p[0]))
+
+def group_by_day(items, day_of):
+    grouped = defaultdict(list)
+    for item in items:
+        day = day_of(item)
+        if day:
+            grouped[day].append(item)
+    return grouped
+
+def days_between(start, end):
+    return [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1)]
+
+def hours(seconds):
+    return round(seconds / 3600, 2)
+
+def summarize(period, steps_by_day, sleep_by_day, activities_by_day):
+    """
+    Notion properties of one period: steps against the goal, average sleep stages, and
+    activity totals with a breakdown per Activity Type.
+    """
+    kind, name, start, end = period
+    days = days_between(start, end)
+
+    daily_steps = [steps for day in days for steps in steps_by_day.get(day, [])]
+    total_steps = sum(steps.get('totalSteps') or 0 for steps in daily_steps)
+    step_goal = sum(steps.get('stepGoal') or 0 for steps in daily_steps)
+    goal_days = sum(1 for steps in daily_steps if steps.get('stepGoal') and (steps.get('totalSteps') or 0) >= steps['stepGoal'])
+
+    nights = [
+        sleep_data['dailySleepDTO'] for day in days for sleep_data in sleep_by_day.get(day, [])
+        if sleep_data['dailySleepDTO'].get('sleepTimeSeconds')
+    ]
+
+    def average_sleep(key):
+        return hours(sum(night.get(key) or 0 for night in nights) / len(nights)) if nights else 0
+
+    by_type = defaultdict(lambda: {"count": 0, "distance": 0, "duration": 0, "load": 0})
+    classifier = get_classifier()
+    for day in days:
+        for activity in activities_by_day.get(day, []):
+            activity_type, _ = classifier.classify(activity.get('activityType', {}).get('typeKey', 'Unknown'),
+                                                   activity.get('activityName', ''))
+            totals = by_type[activity_type]
+            totals["count"] += 1
+            totals["distance"] += activity.get('distance') or 0
+            totals["duration"] += activity.get('duration') or 0
+            totals["load"] += activity.get('activityTrainingLoad') or 0
+
+    breakdown = "\n".join(
+        f"{activity_type}: {totals['count']} · {totals['distance'] / 1000:.1f} km · "
+        f"{hours(totals['duration'])} h · load {round(totals['load'])}"
+        for activity_type, totals in sorted(by_type.items(), key=lambda item: -item[1]["duration"])
+    )
+
+    return {
+        "Period": {"title": [{"text": {"content": name}}]},
+        "Period Type": {"select": {"name": kind}},
+        "Date": {"date": {"start": start.isoformat(), "end": end.isoformat()}},
+        "Total Steps": {"number": total_steps},
+        "Step Goal": {"number": step_goal},
+        "Goal Days": {"number": goal_days},
+        "Avg Steps": {"number": round(total_steps / len(daily_steps)) if daily_steps else 0},
+        "Sleep Nights": {"number": len(nights)},
+        "Avg Sleep (h)": {"number": average_sleep('sleepTimeSeconds')},
+        "Avg Deep Sleep (h)": {"number": average_sleep('deepSleepSeconds')},
+        "Avg Light Sleep (h)": {"number": average_sleep('lightSleepSeconds')},
+        "Avg REM Sleep (h)": {"number": average_sleep('remSleepSeconds')},
+        "Avg Awake Time (h)": {"number": average_sleep('awakeSleepSeconds')},
+        "Activities": {"number": sum(totals["count"] for totals in by_type.values())},
+        "Distance (km)": {"number": round(sum(totals["distance"] for totals in by_type.values()) / 1000, 2)},
+        "Duration (h)": {"number": hours(sum(totals["duration"] for totals in by_type.values()))},
+        "Training Load": {"number": round(sum(totals["load"] for totals in by_type.values()), 1)},
+        "By Activity Type": {"rich_text": [{"text": {"content": breakdown}}]},
+    }
+
+def get_summary_index(client, database_id, start):
+    """
+    Get the summary pages of the periods ending on or after start, indexed by (Period Type, Period).
+    """
+    index = {}
+    for page in iterate_paginated_api(
+        client.databases.query,
+        database_id=database_id,
+        page_size=100,
+        filter={"property": "Date", "date": {"on_or_after": start.isoformat()}}
+    ):
+        props = page['properties']
+        name = "".join(t.get('plain_text', '') for t in props.get('Period', {}).get('title', []))
+        kind = (props.get('Period Type', {}).get('select') or {}).get('name')
+        index.setdefault((kind, name), page)
+    return index
+
+def probe(garmin):
+    # Change probe: summaries only read the mirror, so its last change is enough (no Garmin request)
+    mirror = GarminMirror()
+    try:
+        return {"mirror": mirror.last_updated(SOURCE_TABLES)}
+    finally:
+        mirror.close()
+
+def sync(garmin, client, database_id, full=False, replay=False):
+    """
+    Write weekly and monthly summaries computed from the local mirror, which the other
+    stages fill. Only the periods with steps, sleep or activities that changed since the
+    last run are recomputed, or every period with full. Garmin is never called, so
+    replay changes nothing.
+    """
+    mirror = GarminMirror()
+    # Taken before reading, so a change saved meanwhile is picked up by the next run
+    last_updated = mirror.last_updated(SOURCE_TABLES)
+    since = None if full else load_state().get('summaries', {}).get('updated_at')
+    periods = touched_periods(mirror, since)
+
+    # Creates and updates are counted once Notion accepted them
+    writes = WriteCounts("created", "updated")
+    unchanged = 0
+    if periods:
+        first = min(period[2] for period in periods)
+        last = max(period[3] for period in periods)
+        # One read of each table for the whole span, activities padded for the UTC sort key
+        steps_by_day = group_by_day(mirror.load_daily_steps(first, last), steps_day)
+        sleep_by_day = group_by_day(mirror.load_sleep(first, last), sleep_day)
+        activities_by_day = group_by_day(
+            mirror.load("activities", (first - timedelta(days=1)).isoformat(), f"{last + timedelta(days=1)} 23:59:59"),
+            activity_day
+        )
+        existing_pages = get_summary_index(client, database_id, first)
+
+        for period in periods:
+            properties = summarize(period, steps_by_day, sleep_by_day, activities_by_day)
+            existing = existing_pages.get((period[0], period[1]))
+            if existing is None:
+                writes.add("created", client.pages.create(parent={"database_id": database_id}, properties=properties))
+                continue
+            changes = changed_properties(existing['properties'], properties)
+            if changes:
+                writes.add("updated", client.pages.update(page_id=existing['id'], properties=changes))
+            else:
+                unchanged += 1
+
+    client.flush()
+    mirror.close()
+    if not client.dry_run and not client.failures:
+        update_state('summaries', {"updated_at": last_updated})
+    totals = writes.totals()
+    print(f"Summaries: {totals['created']} created, {totals['updated']} updated, {unchanged} unchanged")
+    return {**totals, "unchanged": unchanged}
+
+def main():
+    parser = argparse.ArgumentParser(description="Write weekly and monthly summaries of the mirrored Garmin data to Notion")
+    parser.add_argument("--full", action="store_true", help="recompute every period instead of the ones with new data")
+    parser.add_argument("--force", action="store_true", help="run even when the mirror has not changed since the last run")
+    add_plan_arguments(parser)
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    notion_token = os.getenv("NOTION_TOKEN")
+    database_id = os.getenv("NOTION_SUMMARY_DB_ID")
+
+    # Summaries are computed from the local mirror, no Garmin login needed
+    notion = make_notion_client(notion_token)
+    garmin, metrics = instrument(None, notion)
+    client = NotionWriter(notion)
+
+    if args.execute_plan:
+        execute_plan(load_plan(args.execute_plan), client)
+    else:
+        run_planned(args, client, "summaries", database_id,
+                    probed("summaries", lambda: probe(garmin), lambda client: sync(garmin, client, database_id, args.full),
+                           args.force or args.full))
+    client.close()
+    report_metrics(metrics)
+    if client.failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,15 @@
 from datetime import date, datetime
-from garminconnect import Garmin
-from notion_client import Client
+from garmin_session import garmin_login
+from notion_client.helpers import iterate_paginated_api
+from notion_writer import NotionWriter, WriteCounts, make_notion_client
+from garmin_mirror import GarminMirror
+from instrumentation import instrument, report_metrics
+from sync_plan import add_plan_arguments, run_planned, load_plan, execute_plan
+from sync_probe import probed, payload_hash, newest_activity_id
+from sync_state import load_state, update_state
+from best_efforts import BestEffortIndex, DISTANCE_EFFORTS, fit_efforts_enabled, pending_activities, update_best_efforts
+import argparse
+import sys
 import os
 
 def get_icon_for_record(activity_name):
@@ -156,29 +165,134 @@ def replace_activity_name_by_typeId(typeId):
     }
     return typeId_name_map.get(typeId, "Unnamed Activity")
 
-def get_existing_record(client, database_id, activity_name):
-    query = client.databases.query(
-        database_id=database_id,
-        filter={
-            "and": [
-                {"property": "Record", "title": {"equals": activity_name}},
-                {"property": "PR", "checkbox": {"equals": True}}
-            ]
+def get_record_index(client, database_id):
+    """
+    Load the whole PR database once and index it by (Record, Date) and by Record for current PRs.
+    """
+    by_date = {}
+    current_prs = {}
+    for page in iterate_paginated_api(client.databases.query, database_id=database_id, page_size=100):
+        props = page['properties']
+        name = "".join(t.get('plain_text', '') for t in props.get('Record', {}).get('title', []))
+        date_prop = props.get('Date', {}).get('date') or {}
+        if date_prop.get('start'):
+            by_date.setdefault((name, date_prop['start'][:10]), page)
+        if props.get('PR', {}).get('checkbox'):
+            current_prs.setdefault(name, page)
+    return by_date, current_prs
+
+def planned_page(action):
+    # Stand-in for the page a planned create will write, so the next records of the same name see it
+    return {"id": None, "planned": action, "properties": {"Date": {"date": {"start": action['date']}}}}
+
+def plan_record(new_record, by_date, current_prs):
+    """
+    Work out the archive/create/update actions for one record without touching Notion.
+    The actions are applied to by_date and current_prs, so records sharing a name are
+    planned as if each one had been written before the next.
+    """
+    activity_date, activity_type, activity_name = new_record['date'], new_record['activity_type'], new_record['record']
+    existing_pr_record = current_prs.get(activity_name)
+    existing_date_record = by_date.get((activity_name, (activity_date or '')[:10]))
+
+    if existing_date_record:
+        if existing_date_record.get('planned'):
+            # Same day as a page still to be created: create that page with this record instead
+            existing_date_record['planned'].update({**new_record, "pr": True})
+            existing_date_record['properties']['Date']['date']['start'] = activity_date
+            current_prs[activity_name] = existing_date_record
+            return []
+        current_prs[activity_name] = existing_date_record
+        return [{"action": "update", "page_id": existing_date_record['id'], **new_record}]
+    if not existing_pr_record:
+        return track_create({"action": "create", **new_record}, by_date, current_prs)
+    try:
+        date_prop = existing_pr_record['properties']['Date']
+        if date_prop and date_prop.get('date') and date_prop['date'].get('start'):
+            existing_date = date_prop['date']['start']
+
+            if activity_date > existing_date:
+                if existing_pr_record.get('planned'):
+                    # The previous PR is not written yet, create it already archived
+                    existing_pr_record['planned']['pr'] = False
+                    return track_create({"action": "create", **new_record}, by_date, current_prs)
+                return [{"action": "archive", "page_id": existing_pr_record['id'],
+                         "date": existing_date, "activity_type": activity_type, "record": activity_name},
+                        *track_create({"action": "create", **new_record}, by_date, current_prs)]
+            return [{"action": "skip", **new_record}]
+        # Handle case where date is missing or improperly formatted
+        print(f"Warning: Record {activity_name} has invalid date format - updating anyway")
+        return [{"action": "update", "page_id": existing_pr_record['id'], **new_record}]
+    except (KeyError, TypeError) as e:
+        print(f"Error processing record {activity_name}: {e}")
+        print(f"Record data: {existing_pr_record['properties']}")
+        # Fallback - create new record if we can't process the existing one properly
+        return track_create({"action": "create", **new_record}, by_date, current_prs)
+
+def track_create(action, by_date, current_prs):
+    page = planned_page(action)
+    by_date[(action['record'], (action['date'] or '')[:10])] = page
+    current_prs[action['record']] = page
+    return [action]
+
+def plan_records(records, by_date, current_prs):
+    """
+    Work out the archive/create/update actions for the Garmin records without touching Notion.
+    """
+    actions = []
+    for record in records:
+        activity_type = format_activity_type(record.get('activityType'))
+        typeId = record.get('typeId', 0)
+        value, pace = format_garmin_value(record.get('value', 0), activity_type, typeId)
+        new_record = {
+            "date": record.get('prStartTimeGmtFormatted'), "activity_type": activity_type,
+            "record": replace_activity_name_by_typeId(typeId), "typeId": typeId, "value": value, "pace": pace,
         }
-    )
-    return query['results'][0] if query['results'] else None
-
-def get_record_by_date_and_name(client, database_id, activity_date, activity_name):
-    query = client.databases.query(
-        database_id=database_id,
-        filter={
-            "and": [
-                {"property": "Record", "title": {"equals": activity_name}},
-                {"property": "Date", "date": {"equals": activity_date}}
-            ]
+        actions += plan_record(new_record, by_date, current_prs)
+    return actions
+
+def format_duration(total_seconds):
+    hours, rest = divmod(round(total_seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def plan_best_efforts(names, bests, by_date, current_prs):
+    """
+    Actions for the records derived from FIT files that improved, with no Garmin typeId.
+    """
+    actions = []
+    for name in sorted(names):
+        best = bests[name]
+        if name in DISTANCE_EFFORTS:
+            value = format_duration(best['value'])
+            pace = f"{format_duration(best['value'] * 1000 / DISTANCE_EFFORTS[name])} /km"
+        else:
+            value, pace = f"{round(best['value'])} W", ""
+        new_record = {
+            "date": best['date'].replace(" ", "T"), "activity_type": best['activity_type'],
+            "record": name, "typeId": None, "value": value, "pace": pace,
         }
-    )
-    return query['results'][0] if query['results'] else None
+        actions += plan_record(new_record, by_date, current_prs)
+    return actions
+
+def apply_record_action(client, database_id, action):
+    # Returns the Notion write of the action, None when nothing was sent
+    kind, activity_type, activity_name = action['action'], action['activity_type'], action['record']
+    if kind == "update":
+        page = update_record(client, action['page_id'], action['date'], action['value'], action['pace'], activity_name, True)
+        print(f"Updated existing record: {activity_type} - {activity_name}")
+        return page
+    elif kind == "archive":
+        page = update_record(client, action['page_id'], action['date'], None, None, activity_name, False)
+        print(f"Archived old record: {activity_type} - {activity_name}")
+        return page
+    elif kind == "create":
+        page = write_new_record(client, database_id, action['date'], activity_type, activity_name,
+                                action['typeId'], action['value'], action['pace'], action.get('pr', True))
+        print(f"Created new {'PR' if action.get('pr', True) else 'archived'} record: {activity_type} - {activity_name}")
+        return page
+    else:
+        print(f"No update needed: {activity_type} - {activity_name}")
 
 def update_record(client, page_id, activity_date, value, pace, activity_name, is_pr=True):
     properties = {
@@ -196,7 +310,7 @@ def update_record(client, page_id, activity_date, value, pace, activity_name, is
     cover = get_cover_for_record(activity_name)
 
     try:
-        client.pages.update(
+        return client.pages.update(
             page_id=page_id,
             properties=properties,
             icon={"emoji": icon},
@@ -206,13 +320,13 @@ def update_record(client, page_id, activity_date, value, pace, activity_name, is
     except Exception as e:
         print(f"Error updating record: {e}")
 
-def write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace):
+def write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace, is_pr=True):
     properties = {
         "Date": {"date": {"start": activity_date}},
         "Activity Type": {"select": {"name": activity_type}},
         "Record": {"title": [{"text": {"content": activity_name}}]},
         "typeId": {"number": typeId},
-        "PR": {"checkbox": True}
+        "PR": {"checkbox": is_pr}
     }
     
     if value:
@@ -225,7 +339,7 @@ def write_new_record(client, database_id, activity_date, activity_type, activity
     cover = get_cover_for_record(activity_name)
 
     try:
-        client.pages.create(
+        return client.pages.create(
             parent={"database_id": database_id},
             properties=properties,
             icon={"emoji": icon},
@@ -234,60 +348,89 @@ def write_new_record(client, database_id, activity_date, activity_type, activity
     except Exception as e:
         print(f"Error writing new record: {e}")
 
+def probe(garmin):
+    # Change probe: the records payload is small, so compare a hash of it (values and PR dates)
+    token = {"records": payload_hash(garmin.get_personal_record())}
+    if fit_efforts_enabled():
+        mirror = GarminMirror()
+        try:
+            backlog = pending_activities(mirror, BestEffortIndex(load_state().get('best_efforts')))
+        finally:
+            mirror.close()
+        if backlog:
+            # FIT files are left to analyze (more than FIT_MAX_DOWNLOADS, or activities mirrored
+            # since the last run): no token, so every run continues until the backlog is done
+            return None
+        # Records derived from FIT files change with every new activity
+        token["activityId"] = newest_activity_id(garmin)
+    return token
+
+def sync(garmin, client, database_id, replay=False):
+    mirror = GarminMirror()
+    if replay:
+        records = mirror.load_personal_records()
+    else:
+        records = garmin.get_personal_record()
+        mirror.save_personal_records(records)
+    filtered_records = [record for record in records if record.get('typeId') != 16]
+
+    by_date, current_prs = get_record_index(client, database_id)
+    actions = plan_records(filtered_records, by_date, current_prs)
+
+    # Records Garmin does not keep (fastest half marathon, best 5/60 min power, ...) from the FIT files
+    # of the activities since the last run; not on replays, which cannot download them
+    efforts = None
+    if fit_efforts_enabled() and not replay:
+        efforts = BestEffortIndex(load_state().get('best_efforts'))
+        improved = update_best_efforts(garmin, mirror, efforts)
+        actions += plan_best_efforts(improved, efforts.bests, by_date, current_prs)
+
+    # Creates and updates are counted once Notion accepted them
+    writes = WriteCounts("created", "updated")
+    for action in actions:
+        page = apply_record_action(client, database_id, action)
+        if page is None:
+            continue
+        # Archiving the previous PR is an update of its page
+        writes.add("created" if action['action'] == "create" else "updated", page)
+        if action['action'] != "archive" and action.get('typeId') is not None:
+            # Remember the page holding the current PR for each record type
+            mirror.remember_page("personal_records", action['typeId'], page)
+
+    client.flush()
+    mirror.close()
+    if efforts is not None and not client.dry_run and not client.failures:
+        update_state('best_efforts', efforts.to_state())
+    return {**writes.totals(), "unchanged": sum(action['action'] == "skip" for action in actions)}
+
 def main():
+    parser = argparse.ArgumentParser(description="Sync Garmin personal records to Notion")
+    parser.add_argument("--replay", action="store_true", help="use the records saved in the local mirror instead of calling Garmin")
+    parser.add_argument("--force", action="store_true", help="sync even when the change probe finds nothing new on Garmin")
+    add_plan_arguments(parser)
+    args = parser.parse_args()
+
     garmin_email = os.getenv("GARMIN_EMAIL")
     garmin_password = os.getenv("GARMIN_PASSWORD")
     notion_token = os.getenv("NOTION_TOKEN")
     database_id = os.getenv("NOTION_PR_DB_ID")
 
-    garmin = Garmin(garmin_email, garmin_password)
-    garmin.login()
+    garmin = None if args.replay or args.execute_plan else garmin_login(garmin_email, garmin_password)
 
-    client = Client(auth=notion_token)
+    notion = make_notion_client(notion_token)
+    garmin, metrics = instrument(garmin, notion)
+    client = NotionWriter(notion)
 
-    records = garmin.get_personal_record()
-    filtered_records = [record for record in records if record.get('typeId') != 16]
-
-    for record in filtered_records:
-        activity_date = record.get('prStartTimeGmtFormatted')
-        activity_type = format_activity_type(record.get('activityType'))
-        activity_name = replace_activity_name_by_typeId(record.get('typeId'))
-        typeId = record.get('typeId', 0)
-        value, pace = format_garmin_value(record.get('value', 0), activity_type, typeId)
-
-        existing_pr_record = get_existing_record(client, database_id, activity_name)
-        existing_date_record = get_record_by_date_and_name(client, database_id, activity_date, activity_name)
-
-        if existing_date_record:
-            update_record(client, existing_date_record['id'], activity_date, value, pace, activity_name, True)
-            print(f"Updated existing record: {activity_type} - {activity_name}")
-        elif existing_pr_record:
-            # Add error handling here
-            try:
-                date_prop = existing_pr_record['properties']['Date']
-                if date_prop and date_prop.get('date') and date_prop['date'].get('start'):
-                    existing_date = date_prop['date']['start']
-                    
-                    if activity_date > existing_date:
-                        update_record(client, existing_pr_record['id'], existing_date, None, None, activity_name, False)
-                        print(f"Archived old record: {activity_type} - {activity_name}")
-                        
-                        write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
-                        print(f"Created new PR record: {activity_type} - {activity_name}")
-                    else:
-                        print(f"No update needed: {activity_type} - {activity_name}")
-                else:
-                    # Handle case where date is missing or improperly formatted
-                    print(f"Warning: Record {activity_name} has invalid date format - updating anyway")
-                    update_record(client, existing_pr_record['id'], activity_date, value, pace, activity_name, True)
-            except (KeyError, TypeError) as e:
-                print(f"Error processing record {activity_name}: {e}")
-                print(f"Record data: {existing_pr_record['properties']}")
-                # Fallback - create new record if we can't process the existing one properly
-                write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
-        else:
-            write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
-            print(f"Successfully written new record: {activity_type} - {activity_name}")
+    if args.execute_plan:
+        execute_plan(load_plan(args.execute_plan), client)
+    else:
+        run_planned(args, client, "records", database_id,
+                    probed("records", lambda: probe(garmin), lambda client: sync(garmin, client, database_id, args.replay),
+                           args.force or args.replay))
+    client.close()
+    report_metrics(metrics)
+    if client.failures:
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
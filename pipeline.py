@@ -0,0 +1,94 @@
+import threading
+import queue
+import os
+
+# Items buffered between two pipeline stages before the upstream stage waits
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 200))
+# Threads running the transform stage of a pipeline
+TRANSFORM_WORKERS = int(os.getenv("TRANSFORM_WORKERS", 2))
+
+_DONE = object()
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+def _put(q, item, stop):
+    # Block while the queue is full, giving up once the consumer has gone away
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+def pipeline(source, *stages, maxsize=PIPELINE_QUEUE_SIZE):
+    """
+    Run `source` (any iterable, e.g. a Garmin fetch generator) in its own thread and pass
+    each item through `stages`, given as (func, workers) pairs, each on its own threads.
+    Stages are connected by bounded queues, so a fast stage waits for a slow one instead
+    of buffering everything. Yields the results of the last stage as they come, which is
+    not necessarily the source order when a stage has more than one worker. An exception
+    in any stage is raised in the consumer.
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize) for _ in range(len(stages) + 1)]
+
+    def produce():
+        try:
+            for item in source:
+                if not _put(queues[0], item, stop):
+                    return
+        except Exception as e:
+            _put(queues[0], _Failure(e), stop)
+            return
+        _put(queues[0], _DONE, stop)
+
+    def work(func, inbox, outbox, remaining, lock):
+        while True:
+            item = _get(inbox, stop)
+            if item is _DONE:
+                # Leave the marker for the other workers of this stage, the last one passes it on;
+                # once stopped, _get returns it without taking it, and the inbox may be full
+                _put(inbox, _DONE, stop)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    _put(outbox, _DONE, stop)
+                return
+            if not isinstance(item, _Failure):
+                try:
+                    item = func(item)
+                except Exception as e:
+                    item = _Failure(e)
+            if not _put(outbox, item, stop):
+                return
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    for i, (func, workers) in enumerate(stages):
+        workers = max(1, workers)
+        args = (func, queues[i], queues[i + 1], [workers], threading.Lock())
+        threads += [threading.Thread(target=work, args=args, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
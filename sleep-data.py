@@ -1,8 +1,17 @@
-from datetime import datetime
-from garminconnect import Garmin
-from notion_client import Client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from garmin_session import garmin_login
+from notion_client.helpers import iterate_paginated_api
+from notion_writer import NotionWriter, WriteCounts, make_notion_client
+from garmin_mirror import GarminMirror
+from instrumentation import instrument, report_metrics
+from sync_plan import add_plan_arguments, run_planned, load_plan, execute_plan
+from sync_probe import probed, device_upload_time
+from sync_state import load_checkpoint, save_checkpoint, clear_checkpoint, CHECKPOINT_EVERY
 from dotenv import load_dotenv, dotenv_values
+import argparse
 import pytz
+import sys
 import os
 
 # Constants
@@ -12,9 +21,17 @@ local_tz = pytz.timezone("America/New_York")
 load_dotenv()
 CONFIG = dotenv_values()
 
-def get_sleep_data(garmin):
-    today = datetime.today().date()
-    return garmin.get_sleep_data(today.isoformat())
+# Nights fetched from Garmin at the same time during a backfill
+GARMIN_MAX_WORKERS = int(os.getenv("GARMIN_MAX_WORKERS", 4))
+
+def get_sleep_data(garmin, day=None):
+    day = day or datetime.today().date()
+    return garmin.get_sleep_data(day.isoformat())
+
+def get_sleep_data_range(garmin, days, max_workers=GARMIN_MAX_WORKERS):
+    # Fetch several nights concurrently, keeping the order of `days`
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda day: get_sleep_data(garmin, day), days))
 
 def format_duration(seconds):
     minutes = (seconds or 0) // 60
@@ -35,13 +52,24 @@ def format_time_readable(timestamp):
 def format_date_for_name(sleep_date):
     return datetime.strptime(sleep_date, "%Y-%m-%d").strftime("%d.%m.%Y") if sleep_date else "Unknown"
 
-def sleep_data_exists(client, database_id, sleep_date):
-    query = client.databases.query(
+def get_existing_sleep_dates(client, database_id, start, end):
+    # One range query on "Long Date" instead of one query per night
+    dates = set()
+    for page in iterate_paginated_api(
+        client.databases.query,
         database_id=database_id,
-        filter={"property": "Long Date", "date": {"equals": sleep_date}}
-    )
-    results = query.get('results', [])
-    return results[0] if results else None  # Ensure it returns None instead of causing IndexError
+        page_size=100,
+        filter={
+            "and": [
+                {"property": "Long Date", "date": {"on_or_after": start.isoformat()}},
+                {"property": "Long Date", "date": {"on_or_before": end.isoformat()}}
+            ]
+        }
+    ):
+        date_prop = page['properties'].get('Long Date', {}).get('date') or {}
+        if date_prop.get('start'):
+            dates.add(date_prop['start'][:10])
+    return dates
 
 def create_sleep_data(client, database_id, sleep_data, skip_zero_sleep=True):
     daily_sleep = sleep_data.get('dailySleepDTO', {})
@@ -76,10 +104,88 @@ def create_sleep_data(client, database_id, sleep_data, skip_zero_sleep=True):
         "Resting HR": {"number": sleep_data.get('restingHeartRate', 0)}
     }
     
-    client.pages.create(parent={"database_id": database_id}, properties=properties, icon={"emoji": "😴"})
+    page = client.pages.create(parent={"database_id": database_id}, properties=properties, icon={"emoji": "😴"})
     print(f"Created sleep entry for: {sleep_date}")
+    return page
+
+def probe(garmin):
+    # Change probe: new sleep data needs an upload from the watch, and the default range moves with the day
+    return {"upload": device_upload_time(garmin), "day": date.today().isoformat()}
+
+def sync(garmin, client, database_id, start=None, end=None, replay=False, resume=False):
+    mirror = GarminMirror()
+    if replay and not (start or end):
+        # A replay without a range rebuilds every night in the mirror
+        start, end = mirror.date_range("sleep") or (None, None)
+    today = datetime.today().date()
+    start = start or today
+    end = end or today
+
+    # A resumed run picks up the interrupted one's range from the first night it had not finished
+    checkpoint = load_checkpoint('sleep') if resume else None
+    first = start
+    if checkpoint:
+        start, end = date.fromisoformat(checkpoint['start']), date.fromisoformat(checkpoint['end'])
+        first = date.fromisoformat(checkpoint['next'])
+        print(f"Resuming sleep data {start} to {end} from {first}")
+    elif resume:
+        print("No interrupted sleep sync to resume")
+    days = [first + timedelta(days=x) for x in range((end - first).days + 1)]
+
+    # Nights already mapped to a Notion page in the mirror don't need a Notion query,
+    # unless we are replaying into a possibly rebuilt database
+    known_dates = set() if replay else set(mirror.page_ids("sleep"))
+    if all(day.isoformat() in known_dates for day in days):
+        existing_dates = known_dates
+    else:
+        existing_dates = get_existing_sleep_dates(client, database_id, first, end)
+
+    # Only fetch the nights that are not in Notion yet, a checkpoint's worth at a time
+    missing_days = [day for day in days if day.isoformat() not in existing_dates]
+    unchanged = len(days) - len(missing_days)
+    # Creates are counted once Notion accepted them
+    writes = WriteCounts("created")
+    for i in range(0, len(missing_days), CHECKPOINT_EVERY):
+        batch = missing_days[i:i + CHECKPOINT_EVERY]
+        if replay:
+            sleep_data = mirror.load_sleep(batch[0], batch[-1])
+        else:
+            sleep_data = get_sleep_data_range(garmin, batch)
+            mirror.save_sleep(sleep_data)
+
+        for data in sleep_data:
+            if data:
+                sleep_date = data.get('dailySleepDTO', {}).get('calendarDate')
+                if sleep_date and sleep_date not in existing_dates:
+                    page = create_sleep_data(client, database_id, data, skip_zero_sleep=True)
+                    mirror.remember_page("sleep", sleep_date, page)
+                    existing_dates.add(sleep_date)
+                    if page is not None:
+                        writes.add("created", page)
+
+        # Record the first night left to do once the batch is written; after a failed write it stays put
+        client.flush()
+        mirror.save_pending()
+        if not client.dry_run and not client.failures:
+            save_checkpoint('sleep', {"start": start.isoformat(), "end": end.isoformat(),
+                                      "next": (batch[-1] + timedelta(days=1)).isoformat()})
+
+    client.flush()
+    mirror.close()
+    if not client.dry_run and not client.failures:
+        clear_checkpoint('sleep')
+    return {**writes.totals(), "updated": 0, "unchanged": unchanged}
 
 def main():
+    parser = argparse.ArgumentParser(description="Sync Garmin sleep data to Notion")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, help="first night to sync (YYYY-MM-DD), default today")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, help="last night to sync (YYYY-MM-DD), default today")
+    parser.add_argument("--replay", action="store_true", help="use the nights saved in the local mirror instead of calling Garmin")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted sync from its last checkpoint")
+    parser.add_argument("--force", action="store_true", help="sync even when the change probe finds nothing new on Garmin")
+    add_plan_arguments(parser)
+    args = parser.parse_args()
+
     load_dotenv()
 
     # Initialize Garmin and Notion clients using environment variables
@@ -88,16 +194,25 @@ def main():
     notion_token = os.getenv("NOTION_TOKEN")
     database_id = os.getenv("NOTION_SLEEP_DB_ID")
 
-    # Initialize Garmin client and login
-    garmin = Garmin(garmin_email, garmin_password)
-    garmin.login()
-    client = Client(auth=notion_token)
+    # Initialize Garmin client, reusing the saved session when possible
+    garmin = None if args.replay or args.execute_plan else garmin_login(garmin_email, garmin_password)
+    notion = make_notion_client(notion_token)
+    garmin, metrics = instrument(garmin, notion)
+    client = NotionWriter(notion)
 
-    data = get_sleep_data(garmin)
-    if data:
-        sleep_date = data.get('dailySleepDTO', {}).get('calendarDate')
-        if sleep_date and not sleep_data_exists(client, database_id, sleep_date):
-            create_sleep_data(client, database_id, data, skip_zero_sleep=True)
+    if args.execute_plan:
+        execute_plan(load_plan(args.execute_plan), client)
+    else:
+        # Explicit ranges are backfills, always run them
+        skip_probe = args.force or args.replay or args.resume or args.start or args.end
+        run_planned(args, client, "sleep", database_id,
+                    probed("sleep", lambda: probe(garmin),
+                           lambda client: sync(garmin, client, database_id, args.start, args.end, args.replay, args.resume),
+                           skip_probe))
+    client.close()
+    report_metrics(metrics)
+    if client.failures:
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,194 @@
+from concurrent.futures import ThreadPoolExecutor
+from garmin_session import garmin_login
+from notion_writer import NotionWriter, make_notion_client
+from instrumentation import instrument, report_metrics
+from sync_plan import PlanRecorder, add_plan_arguments, build_plan, report_plan, load_plan, execute_plan
+from sync_daemon import run_daemon
+from sync_probe import run_if_changed
+from best_efforts import fit_efforts_enabled
+from dotenv import load_dotenv
+import importlib.util
+import argparse
+import time
+import sys
+import os
+
+# Sync stages with their script and the environment variable holding their Notion database id
+STAGES = {
+    "activities": ("garmin-activities.py", "NOTION_DB_ID"),
+    "records": ("personal-records.py", "NOTION_PR_DB_ID"),
+    "steps": ("daily-steps.py", "NOTION_STEPS_DB_ID"),
+    "sleep": ("sleep-data.py", "NOTION_SLEEP_DB_ID"),
+    "summaries": ("period-summaries.py", "NOTION_SUMMARY_DB_ID"),
+}
+
+# Stages that checkpoint their progress and accept --resume
+RESUMABLE = {"activities", "steps", "sleep"}
+
+# Stages reading what the other stages save to the mirror, run once those finished
+LATE_STAGES = {"summaries"}
+
+def late_stages():
+    # With FIT efforts, records analyze the activities the activities stage has just mirrored
+    return LATE_STAGES | {"records"} if fit_efforts_enabled() else LATE_STAGES
+
+def load_stage(script):
+    """
+    Import one of the sync scripts as a module (their file names are not valid module names).
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+    spec = importlib.util.spec_from_file_location(script[:-3].replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def run_stage(name, module, garmin, client, database_id, probe=False, **kwargs):
+    """
+    Run one stage, returning its error (instead of raising, so the other stages keep going),
+    counts and duration. Notion writes that failed during the stage are an error too.
+    With probe, the stage is skipped when its change probe finds nothing new on Garmin.
+    """
+    started = time.monotonic()
+    # Stages running alongside share the writer, so one's failed writes fail them all
+    failures = client.failures
+    try:
+        def run():
+            return module.sync(garmin, client, database_id, **kwargs)
+        counts = run_if_changed(name, lambda: module.probe(garmin), run, client) if probe else run()
+        if client.dry_run:
+            client.counts = counts or {}
+    except Exception as e:
+        print(f"Stage {name} failed: {e}")
+        return {"error": e, "counts": None, "seconds": round(time.monotonic() - started, 1)}
+    if client.failures > failures:
+        error = RuntimeError(f"{client.failures - failures} Notion writes failed")
+        print(f"Stage {name} failed: {error}")
+        return {"error": error, "counts": counts, "seconds": round(time.monotonic() - started, 1)}
+    print(f"Stage {name} done in {time.monotonic() - started:.1f}s")
+    return {"error": None, "counts": counts, "seconds": round(time.monotonic() - started, 1)}
+
+def run_stages(stages, garmin, clients, replay=False, resume=False, force=False):
+    """
+    Run the stages concurrently, each with its client, and return the result of each stage (see run_stage).
+    Stages are probed for new Garmin data first, unless forced, replayed or resumed.
+    The late stages (see late_stages) start once the others are done.
+    """
+    probe = not (force or replay or resume)
+    results = {}
+    late_names = late_stages()
+    for late in (False, True):
+        group = {name: stage for name, stage in stages.items() if (name in late_names) == late}
+        if not group:
+            continue
+        with ThreadPoolExecutor(max_workers=len(group)) as executor:
+            futures = {
+                name: executor.submit(run_stage, name, module, garmin, clients[name], database_id, probe, replay=replay,
+                                      **({"resume": resume} if name in RESUMABLE else {}))
+                for name, (module, database_id) in group.items()
+            }
+            results.update({name: future.result() for name, future in futures.items()})
+    return results
+
+def load_stages(names=None):
+    """
+    Load the scripts of the given stages (all by default), skipping those without a database id.
+    """
+    stages = {}
+    for name in names or STAGES:
+        script, env_var = STAGES[name]
+        database_id = os.getenv(env_var)
+        if database_id:
+            stages[name] = (load_stage(script), database_id)
+        else:
+            print(f"Skipping {name}: {env_var} is not set")
+    return stages
+
+def sync_all(names=None, replay=False, resume=False, force=False, limiter=None):
+    """
+    Run the stages once with one Garmin login and one Notion writer, like sync-all.py
+    without --dry-run or --daemon, and return the result of each stage. The writer
+    can share the rate `limiter` of other writers using the same Notion token.
+    """
+    stages = load_stages(names)
+    garmin = None if replay else garmin_login(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD"))
+    notion = make_notion_client(os.getenv("NOTION_TOKEN"))
+    garmin, metrics = instrument(garmin, notion)
+    client = NotionWriter(notion, limiter=limiter)
+    results = run_stages(stages, garmin, {name: client for name in stages}, replay, resume, force)
+    client.close()
+    report_metrics(metrics)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Run all Garmin to Notion syncs with one Garmin login")
+    parser.add_argument("--only", nargs="+", choices=STAGES.keys(), help="run only these stages")
+    parser.add_argument("--replay", action="store_true", help="sync from the local mirror instead of calling Garmin")
+    parser.add_argument("--resume", action="store_true", help="continue interrupted activities, steps and sleep syncs from their checkpoints")
+    parser.add_argument("--force", action="store_true", help="run every stage even when its change probe finds nothing new")
+    parser.add_argument("--daemon", action="store_true", help="keep running, polling Garmin for new data with the same sessions")
+    add_plan_arguments(parser)
+    args = parser.parse_args()
+    if args.daemon and (args.replay or args.dry_run or args.execute_plan):
+        parser.error("--daemon cannot be combined with --replay, --dry-run or --execute-plan")
+
+    load_dotenv()
+
+    garmin_email = os.getenv("GARMIN_EMAIL")
+    garmin_password = os.getenv("GARMIN_PASSWORD")
+    notion_token = os.getenv("NOTION_TOKEN")
+
+    # Stages without a database id are optional and skipped
+    stages = load_stages(args.only)
+
+    # One Garmin login and one rate-limited Notion client shared by every stage
+    garmin = None if args.replay or args.execute_plan else garmin_login(garmin_email, garmin_password)
+    notion = make_notion_client(notion_token)
+    garmin, metrics = instrument(garmin, notion)
+    client = NotionWriter(notion)
+
+    if args.execute_plan:
+        execute_plan(load_plan(args.execute_plan), client, args.only)
+        client.close()
+        report_metrics(metrics)
+        if client.failures:
+            sys.exit(1)
+        return
+
+    # With --dry-run every stage writes into its own plan recorder instead of Notion
+    clients = {
+        name: PlanRecorder(client, name, database_id) if args.dry_run else client
+        for name, (_, database_id) in stages.items()
+    }
+
+    if args.daemon:
+        # The first cycle honors --resume and --force, later ones are regular incremental runs
+        first = [True]
+
+        def run(names):
+            # Each cycle counts its own failed writes and metrics: one failure must not keep every
+            # later cycle from saving its progress, and the process runs for days
+            client.reset_failures()
+            results = run_stages({name: stages[name] for name in names}, garmin, clients,
+                                 resume=first[0] and args.resume, force=first[0] and args.force)
+            first[0] = False
+            report_metrics(metrics)
+            metrics.reset()
+            return results
+        run_daemon(garmin, run, list(stages))
+        client.close()
+        report_metrics(metrics)
+        return
+
+    results = run_stages(stages, garmin, clients, args.replay, args.resume, args.force)
+
+    if args.dry_run:
+        report_plan(build_plan(clients.values()), args.plan_file)
+
+    client.close()
+    report_metrics(metrics)
+
+    if any(result["error"] for result in results.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.managers import BaseManager
+from contextlib import redirect_stdout, redirect_stderr
+from dotenv import load_dotenv
+import multiprocessing
+import importlib.util
+import argparse
+import json
+import time
+import sys
+import os
+
+# Needs Python 3.11+, for tomllib and for a fresh pool process per tenant (max_tasks_per_child)
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+# Tenants synced at the same time
+TENANT_MAX_WORKERS = int(os.getenv("TENANT_MAX_WORKERS", 4))
+
+# Per-account settings a tenant must not inherit from the runner's environment
+TENANT_VARIABLES = (
+    "GARMIN_EMAIL", "GARMIN_PASSWORD", "GARMINTOKENS", "NOTION_TOKEN", "GARMIN_STATE_FILE", "GARMIN_MIRROR_FILE",
+    "NOTION_DB_ID", "NOTION_PR_DB_ID", "NOTION_STEPS_DB_ID", "NOTION_SLEEP_DB_ID", "NOTION_SUMMARY_DB_ID",
+    "SYNC_METRICS_FILE", "SYNC_METRICS_PROM",
+)
+
+# Database ids of a tenant, by sync-all.py stage name
+STAGE_VARIABLES = {
+    "activities": "NOTION_DB_ID",
+    "records": "NOTION_PR_DB_ID",
+    "steps": "NOTION_STEPS_DB_ID",
+    "sleep": "NOTION_SLEEP_DB_ID",
+    "summaries": "NOTION_SUMMARY_DB_ID",
+}
+
+class RateLimiterManager(BaseManager):
+    """
+    Serves the rate limiters shared by the tenant processes, one per Notion token.
+    """
+
+def load_tenants(path):
+    """
+    Read the tenants of a TOML file, a list of [[tenants]] tables with:
+    * name, garmin_email, and the databases table (stage name -> Notion database id)
+    * garmin_password and notion_token, or garmin_password_env and notion_token_env naming
+      the environment variables holding them, so secrets stay out of the file
+    * directory (optional, default tenants/<name>) holding the tenant's state, mirror,
+      Garmin session and log
+    * env (optional) with extra environment variables, e.g. GARMIN_LOOKBACK_DAYS
+    """
+    with open(path, "rb") as f:
+        tenants = tomllib.load(f).get("tenants", [])
+
+    names = [tenant.get("name") for tenant in tenants]
+    if not all(names) or len(set(names)) != len(names):
+        sys.exit(f"Every tenant in {path} needs a unique name")
+    for tenant in tenants:
+        unknown = set(tenant.get("databases", {})) - set(STAGE_VARIABLES)
+        if unknown:
+            sys.exit(f"Tenant {tenant['name']}: unknown stages {', '.join(sorted(unknown))}")
+    return tenants
+
+def secret(tenant, key):
+    if f"{key}_env" in tenant:
+        return os.getenv(tenant[f"{key}_env"])
+    return tenant.get(key)
+
+def tenant_environment(tenant):
+    """
+    Environment variables one tenant's sync runs with.
+    """
+    directory = tenant.get("directory") or os.path.join("tenants", tenant["name"])
+    # Empty rather than unset, so a .env file loaded by a stage cannot fill them in
+    env = dict.fromkeys(TENANT_VARIABLES, "")
+    env.update({
+        "GARMIN_EMAIL": tenant.get("garmin_email") or "",
+        "GARMIN_PASSWORD": secret(tenant, "garmin_password") or "",
+        "NOTION_TOKEN": secret(tenant, "notion_token") or "",
+        "GARMINTOKENS": secret(tenant, "garmin_tokens") or os.path.join(directory, "garminconnect"),
+        "GARMIN_STATE_FILE": os.path.join(directory, "garmin-sync-state.json"),
+        "GARMIN_MIRROR_FILE": os.path.join(directory, "garmin-mirror.sqlite"),
+    })
+    for name in ("SYNC_METRICS_FILE", "SYNC_METRICS_PROM"):
+        if os.getenv(name):
+            # Each tenant writes its own metrics next to its state instead of overwriting the others'
+            env[name] = os.path.join(directory, os.path.basename(os.environ[name]))
+    for stage, database_id in tenant.get("databases", {}).items():
+        env[STAGE_VARIABLES[stage]] = database_id
+    env.update({name: str(value) for name, value in tenant.get("env", {}).items()})
+    return directory, env
+
+def run_tenant(tenant, limiter, options):
+    """
+    Sync one tenant in its own process. The environment is set before the sync modules
+    are imported, since they read their settings at import time.
+    """
+    started = time.monotonic()
+    directory, env = tenant_environment(tenant)
+    os.makedirs(directory, exist_ok=True)
+    os.environ.update(env)
+
+    with open(os.path.join(directory, "sync.log"), "a", buffering=1) as log, redirect_stdout(log), redirect_stderr(log):
+        print(f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} ===")
+        try:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sync-all.py")
+            spec = importlib.util.spec_from_file_location("sync_all", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            results = module.sync_all(options.get("only"), options.get("replay", False), options.get("resume", False),
+                                      options.get("force", False), limiter)
+        except Exception as e:
+            print(f"Tenant failed: {e}")
+            return {"error": str(e), "stages": {}, "seconds": round(time.monotonic() - started, 1)}
+
+    # Errors are sent back as text, exceptions from the Garmin or Notion libraries may not pickle
+    stages = {name: {**result, "error": str(result["error"]) if result["error"] else None} for name, result in results.items()}
+    return {"error": None, "stages": stages, "seconds": round(time.monotonic() - started, 1)}
+
+def format_result(name, result):
+    if result["error"]:
+        return f"{name}: failed in {result['seconds']}s: {result['error']}"
+    stages = []
+    for stage, values in result["stages"].items():
+        if values["error"]:
+            stages.append(f"{stage} failed ({values['error']})")
+        else:
+            counts = values["counts"] or {}
+            stages.append(f"{stage} {counts.get('created', 0)}/{counts.get('updated', 0)}/{counts.get('unchanged', 0)}")
+    return f"{name}: done in {result['seconds']}s, created/updated/unchanged: {', '.join(stages) or 'no stages'}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run sync-all.py for every tenant of a TOML file in parallel")
+    parser.add_argument("config", help="TOML file listing the tenants")
+    parser.add_argument("--tenants", nargs="+", help="run only these tenants")
+    parser.add_argument("--only", nargs="+", choices=STAGE_VARIABLES.keys(), help="run only these stages")
+    parser.add_argument("--workers", type=int, default=TENANT_MAX_WORKERS, help="tenants synced at the same time")
+    parser.add_argument("--replay", action="store_true", help="sync from each tenant's local mirror instead of calling Garmin")
+    parser.add_argument("--resume", action="store_true", help="continue interrupted syncs from their checkpoints")
+    parser.add_argument("--force", action="store_true", help="run every stage even when its change probe finds nothing new")
+    parser.add_argument("--report", help="save the results of every tenant to this JSON file")
+    args = parser.parse_args()
+    if tomllib is None:
+        parser.error("sync-tenants.py needs Python 3.11 or newer")
+
+    load_dotenv()
+    from notion_writer import RateLimiter, NOTION_RATE_LIMIT
+
+    tenants = [tenant for tenant in load_tenants(args.config) if not args.tenants or tenant["name"] in args.tenants]
+    options = {"only": args.only, "replay": args.replay, "resume": args.resume, "force": args.force}
+
+    # Notion's limit is per integration, so tenants sharing a token share one rate limiter
+    RateLimiterManager.register("RateLimiter", RateLimiter)
+    # Fresh processes, so no tenant sees the modules (and settings) another tenant imported
+    context = multiprocessing.get_context("spawn")
+    manager = RateLimiterManager(ctx=context)
+    manager.start()
+    limiters = {}
+    for tenant in tenants:
+        token = tenant_environment(tenant)[1]["NOTION_TOKEN"]
+        if token not in limiters:
+            limiters[token] = manager.RateLimiter(NOTION_RATE_LIMIT)
+
+    results = {}
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(tenants))), mp_context=context,
+                             max_tasks_per_child=1) as executor:
+        futures = {
+            executor.submit(run_tenant, tenant, limiters[tenant_environment(tenant)[1]["NOTION_TOKEN"]], options): tenant["name"]
+            for tenant in tenants
+        }
+        # A slow or failing tenant holds its own worker only, the others report as they finish
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = {"error": str(e), "stages": {}, "seconds": None}
+            print(format_result(name, results[name]))
+    manager.shutdown()
+
+    failed = [
+        name for name, result in results.items()
+        if result["error"] or any(stage["error"] for stage in result["stages"].values())
+    ]
+    print(f"Tenants: {len(results) - len(failed)} succeeded, {len(failed)} failed in {time.monotonic() - started:.1f}s")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.report}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
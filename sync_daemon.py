@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+from garmin_mirror import GarminMirror
+from sync_state import load_state
+from sync_probe import newest_activity_id
+import threading
+import signal
+import time
+import os
+
+# Seconds between two polls right after a change, and at most while nothing changes
+DAEMON_MIN_INTERVAL = int(os.getenv("DAEMON_MIN_INTERVAL", 300))
+DAEMON_MAX_INTERVAL = int(os.getenv("DAEMON_MAX_INTERVAL", 3600))
+# Seconds between two runs of every stage, for the data the activity probe cannot see (steps, sleep)
+DAEMON_FULL_INTERVAL = int(os.getenv("DAEMON_FULL_INTERVAL", 3 * 3600))
+
+# Stages to run when a new activity shows up
+ACTIVITY_STAGES = ("activities", "records", "summaries")
+
+def busy_hours(activities, share=0.6):
+    """
+    The UTC hours in which activities usually end: the busiest hours until they cover
+    `share` of the activities.
+    """
+    counts = Counter()
+    for activity in activities:
+        try:
+            started = datetime.strptime(activity['startTimeGMT'], "%Y-%m-%d %H:%M:%S")
+        except (KeyError, TypeError, ValueError):
+            continue
+        counts[(started + timedelta(seconds=activity.get('duration') or 0)).hour] += 1
+
+    total = sum(counts.values())
+    hours = set()
+    covered = 0
+    for hour, count in counts.most_common():
+        if covered >= share * total:
+            break
+        hours.add(hour)
+        covered += count
+    return hours
+
+def next_interval(interval, changed, hour, hours):
+    # Poll again soon after a change, back off exponentially while nothing happens,
+    # and keep the shortest interval during the hours activities usually end
+    interval = DAEMON_MIN_INTERVAL if changed else min(interval * 2, DAEMON_MAX_INTERVAL)
+    if hour in hours:
+        interval = min(interval, DAEMON_MIN_INTERVAL)
+    return interval
+
+def load_busy_hours():
+    mirror = GarminMirror()
+    try:
+        return busy_hours(mirror.load_activities())
+    finally:
+        mirror.close()
+
+def run_daemon(garmin, run_stages, stages, stop=None):
+    """
+    Keep the given stages in sync until stopped (SIGTERM/SIGINT or `stop`), reusing the
+    sessions behind `run_stages(names)`. Between runs of every stage, only the newest
+    activity is polled, and the activity stages run when it changes.
+    """
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: stop.set())
+
+    interval = DAEMON_MIN_INTERVAL
+    last_full = None
+    hours = set()
+    while not stop.is_set():
+        changed = False
+        if last_full is None or time.monotonic() - last_full >= DAEMON_FULL_INTERVAL:
+            run_stages(stages)
+            last_full = time.monotonic()
+            hours = load_busy_hours()
+        elif "activities" in stages:
+            try:
+                newest = newest_activity_id(garmin)
+            except Exception as e:
+                # Back off like an idle poll, the next full run reports lasting problems
+                print(f"Daemon: Garmin probe failed: {e}")
+                newest = None
+            # Compared with the token the activities stage saved after its last successful run,
+            # which follows the newest activity back down when that one is deleted
+            known = load_state().get('activities_probe', {}).get('activityId')
+            if newest is not None and newest != known:
+                print(f"Daemon: new activity {newest}")
+                run_stages([name for name in ACTIVITY_STAGES if name in stages])
+                changed = True
+
+        interval = next_interval(interval, changed, datetime.now(timezone.utc).hour, hours)
+        print(f"Daemon: next poll in {interval}s")
+        stop.wait(interval)
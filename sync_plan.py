@@ -0,0 +1,144 @@
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from collections import Counter
+from notion_writer import NOTION_RATE_LIMIT
+import threading
+import json
+
+# Endpoints that only read, so a dry run still sends them to build the plan
+READ_METHODS = {"databases": {"query", "retrieve"}, "pages": {"retrieve"}}
+
+def _finished(result=None):
+    future = Future()
+    future.set_result(result)
+    return future
+
+class _Endpoint:
+    def __init__(self, recorder, name, endpoint):
+        self.recorder = recorder
+        self.name = name
+        self.endpoint = endpoint
+
+    def __getattr__(self, method):
+        if method in READ_METHODS.get(self.name, ()):
+            func = getattr(self.endpoint, method)
+
+            def read(**kwargs):
+                with self.recorder.lock:
+                    self.recorder.reads += 1
+                return func(**kwargs)
+            return read
+        return lambda **kwargs: self.recorder.record(f"{self.name}.{method}", kwargs)
+
+class PlanRecorder:
+    """
+    Stand-in for a NotionWriter used by --dry-run for one stage: reads go to Notion
+    through the writer, while writes are recorded in the plan instead of being sent.
+    Recorded writes return a finished future holding None, so nothing is remembered
+    in the mirror for pages that do not exist yet.
+    """
+
+    dry_run = True
+    # Recorded writes cannot fail
+    failures = 0
+
+    def __init__(self, writer, stage, database_id):
+        self.writer = writer
+        self.stage = stage
+        self.database_id = database_id
+        self.pages = _Endpoint(self, "pages", writer.pages)
+        self.databases = _Endpoint(self, "databases", writer.databases)
+        self.operations = []
+        self.counts = {}
+        self.reads = 0
+        self.lock = threading.Lock()
+
+    def record(self, method, kwargs):
+        with self.lock:
+            self.operations.append({"method": method, "kwargs": kwargs})
+        return _finished()
+
+    def flush(self):
+        pass
+
+    def summary(self):
+        methods = Counter(operation['method'] for operation in self.operations)
+        return {
+            "stage": self.stage,
+            "database_id": self.database_id,
+            "create": methods["pages.create"],
+            "update": methods["pages.update"],
+            # Items the sync left alone, as reported by its counts
+            "skip": self.counts.get("unchanged", 0) + self.counts.get("skipped", 0),
+            "other": sum(methods.values()) - methods["pages.create"] - methods["pages.update"],
+            "reads": self.reads,
+        }
+
+def build_plan(recorders, rate=NOTION_RATE_LIMIT):
+    """
+    Combine the recorded stages into a plan, with the request count and duration it
+    should take at the Notion rate limit.
+    """
+    stages = [recorder.summary() for recorder in recorders]
+    reads = sum(stage["reads"] for stage in stages)
+    writes = sum(len(recorder.operations) for recorder in recorders)
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "rate_limit": rate,
+        "requests": reads + writes,
+        "estimated_seconds": round((reads + writes) / rate, 1) if rate else None,
+        "stages": stages,
+        "operations": [
+            {"stage": recorder.stage, "database_id": recorder.database_id, **operation}
+            for recorder in recorders for operation in recorder.operations
+        ],
+    }
+
+def report_plan(plan, path=None):
+    """
+    Print the per-database counts and the estimate, and save the plan as JSON when a path is given.
+    """
+    print(f"Dry run plan ({plan['requests']} Notion requests, about {plan['estimated_seconds']}s "
+          f"at {plan['rate_limit']:g} req/s):")
+    for stage in plan["stages"]:
+        print(f"  {stage['stage']} ({stage['database_id']}): {stage['create']} to create, "
+              f"{stage['update']} to update, {stage['skip']} to skip")
+    if path:
+        with open(path, "w") as f:
+            json.dump(plan, f, indent=2)
+        print(f"Plan saved to {path}")
+
+def load_plan(path):
+    with open(path) as f:
+        return json.load(f)
+
+def execute_plan(plan, client, stages=None):
+    """
+    Send the writes of a saved plan (optionally only for some stages) through a NotionWriter.
+    """
+    sent = 0
+    for operation in plan["operations"]:
+        if stages and operation["stage"] not in stages:
+            continue
+        endpoint, method = operation["method"].split(".", 1)
+        getattr(getattr(client, endpoint), method)(**operation["kwargs"])
+        sent += 1
+    client.flush()
+    print(f"Plan executed: {sent} writes from {plan['created_at']}")
+    return sent
+
+def add_plan_arguments(parser):
+    parser.add_argument("--dry-run", action="store_true", help="read Notion and print the planned changes without writing them")
+    parser.add_argument("--plan-file", help="with --dry-run, save the plan to this JSON file")
+    parser.add_argument("--execute-plan", metavar="PLAN_FILE", help="apply a plan saved by --dry-run instead of syncing")
+
+def run_planned(args, writer, stage, database_id, sync):
+    """
+    Call `sync(client)` with the writer, or with --dry-run with a recorder whose plan is then reported.
+    """
+    if not args.dry_run:
+        return sync(writer)
+    recorder = PlanRecorder(writer, stage, database_id)
+    recorder.counts = sync(recorder) or {}
+    report_plan(build_plan([recorder]), args.plan_file)
+    return recorder.counts
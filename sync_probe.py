@@ -0,0 +1,46 @@
+from sync_state import load_state, update_state
+import hashlib
+import json
+
+def newest_activity_id(garmin):
+    # One small Garmin request telling whether there is a new activity
+    activities = garmin.get_activities(0, 1)
+    return activities[0].get('activityId') if activities else None
+
+def device_upload_time(garmin):
+    # When the watch last uploaded anything (steps, sleep, ...) to Garmin Connect
+    device = garmin.get_device_last_used() or {}
+    return device.get('lastUsedDeviceUploadTime')
+
+def payload_hash(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def probed(stage, probe, sync, skip_probe=False):
+    """
+    Wrap a `sync(client)` callable so that it only runs when `probe()` reports new Garmin data.
+    """
+    if skip_probe:
+        return sync
+    return lambda client: run_if_changed(stage, probe, lambda: sync(client), client)
+
+def run_if_changed(stage, probe, run, client):
+    """
+    Call `run()` unless `probe()` returns the same token as after the stage's last
+    successful run, in which case Garmin has nothing new and the stage is skipped.
+    The token is saved only when every write of the run went through.
+    """
+    try:
+        token = probe()
+    except Exception as e:
+        print(f"{stage}: change probe failed ({e}), syncing anyway")
+        token = None
+
+    section = f"{stage}_probe"
+    if token is not None and load_state().get(section) == token:
+        print(f"{stage}: nothing new on Garmin, skipped")
+        return {"created": 0, "updated": 0, "unchanged": 0}
+
+    counts = run()
+    if token is not None and not client.dry_run and not client.failures:
+        update_state(section, token)
+    return counts
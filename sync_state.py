@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+
+# Local file holding what previous runs already synced
+STATE_FILE = os.getenv("GARMIN_STATE_FILE", "garmin-sync-state.json")
+
+# Items a long sync processes between two checkpoints
+CHECKPOINT_EVERY = int(os.getenv("CHECKPOINT_EVERY", 100))
+
+# Sync stages may run concurrently in one process and each owns a section of the file
+_lock = threading.Lock()
+
+def load_state(path=STATE_FILE):
+    """
+    Load the sync state saved by previous runs, or an empty state if there is none.
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_state(state, path=STATE_FILE):
+    """
+    Write the sync state atomically so an interrupted run never leaves a truncated file.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def update_state(section, values, path=STATE_FILE):
+    """
+    Replace one section of the state file, keeping the sections written by other stages.
+    A section set to None is removed.
+    """
+    with _lock:
+        state = load_state(path)
+        if values is None:
+            state.pop(section, None)
+        else:
+            state[section] = values
+        save_state(state, path)
+
+def load_checkpoint(stage, path=STATE_FILE):
+    """
+    Return where an interrupted run of a stage stopped, or None if it finished.
+    """
+    return load_state(path).get(f"{stage}_checkpoint")
+
+def save_checkpoint(stage, values, path=STATE_FILE):
+    update_state(f"{stage}_checkpoint", values, path)
+
+def clear_checkpoint(stage, path=STATE_FILE):
+    update_state(f"{stage}_checkpoint", None, path)
+
+class Progress:
+    """
+    Track how far into an ordered source a sync got when items finish out of order:
+    `position` counts the leading items that are all done, and `last` is the last of them.
+    """
+
+    def __init__(self, position=0):
+        self.position = position
+        self.last = None
+        self.done = {}
+
+    def mark(self, index, item):
+        self.done[index] = item
+        while self.position in self.done:
+            self.last = self.done.pop(self.position)
+            self.position += 1
@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import garmin_session
+
+
+class FakeGarth:
+    def __init__(self):
+        self.dumped = None
+
+    def dump(self, path):
+        self.dumped = path
+
+
+class FakeGarmin:
+    """
+    Stands in for garminconnect.Garmin: loading a tokenstore fails like a missing folder does,
+    and the lookup of GARMINTOKENS without a tokenstore is the one garminconnect makes.
+    """
+
+    instances = []
+
+    def __init__(self, email, password):
+        self.garth = FakeGarth()
+        self.credential_login = False
+        FakeGarmin.instances.append(self)
+
+    def login(self, tokenstore=None):
+        tokenstore = tokenstore or os.getenv("GARMINTOKENS")
+        if tokenstore:
+            raise FileNotFoundError(f"{tokenstore}/oauth1_token.json")
+        self.credential_login = True
+
+
+def test_missing_tokenstore_falls_back_to_credentials(monkeypatch, tmp_path):
+    tokenstore = str(tmp_path / "nonexistent-tokens")
+    monkeypatch.setenv("GARMINTOKENS", tokenstore)
+    monkeypatch.setattr(garmin_session, "Garmin", FakeGarmin)
+    FakeGarmin.instances = []
+
+    garmin = garmin_session.garmin_login("athlete@example.com", "secret")
+
+    assert garmin.credential_login
+    assert garmin.garth.dumped == tokenstore
+    # The tokenstore is only hidden during the password login
+    assert os.environ["GARMINTOKENS"] == tokenstore